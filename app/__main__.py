@@ -0,0 +1,52 @@
+"""Command line entry point.
+
+    python -m app [worker] [--once]   headless sync loop (or a single sync)
+    python -m app serve [--port N]    web UI and API via uvicorn
+
+Only ``serve`` imports the web stack.
+"""
+import argparse
+import asyncio
+import sys
+
+from .logging_setup import configure_logging
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app", description="Cloudflare DDNS updater")
+    sub = parser.add_subparsers(dest="command")
+    worker = sub.add_parser("worker", help="run the sync loop without the web UI (default)")
+    worker.add_argument("--once", action="store_true", help="run a single sync and exit; non-zero exit on failure")
+    serve = sub.add_parser("serve", help="run the web UI and API")
+    serve.add_argument("--host", default="0.0.0.0")
+    serve.add_argument("--port", type=int, default=8080)
+    serve.add_argument("--workers", type=int, default=1)
+    # `python -m app --once` is the same as `python -m app worker --once`
+    parser.add_argument("--once", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        import uvicorn
+
+        uvicorn.run(
+            "app.main:app", host=args.host, port=args.port, workers=args.workers, proxy_headers=True,
+            timeout_graceful_shutdown=5,
+        )
+        return 0
+
+    configure_logging()
+    from .config import ConfigManager
+    from .worker import CONFIG_SECRET, run_forever, run_once
+
+    cfg = ConfigManager(secret=CONFIG_SECRET)
+    try:
+        if args.once:
+            return 0 if asyncio.run(run_once(cfg)) else 1
+        asyncio.run(run_forever(cfg))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,68 +1,347 @@
 import asyncio
 import httpx
 import logging
+import os
+import random
 import time
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+from . import metrics
+from .ratelimit import TokenBucket
+from .resilience import CircuitBreakers, CircuitOpenError, DeadlineExceeded, LatencyWindow, deadline_at, remaining
 
 logger = logging.getLogger(__name__)
 
+# Connection pool tuning for the shared client; see CloudflareClientManager.
+MAX_CONNECTIONS = int(os.environ.get("CF_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("CF_MAX_KEEPALIVE_CONNECTIONS", "10"))
+KEEPALIVE_EXPIRY = float(os.environ.get("CF_KEEPALIVE_EXPIRY", "60"))
+HTTP2 = os.environ.get("CF_HTTP2", "false").lower() in ("true", "1", "on", "yes")
+# Cloudflare allows 1200 requests per 5 minutes per user, i.e. 4 req/s.
+RATE_LIMIT = float(os.environ.get("CF_RATE_LIMIT", "4"))
+RATE_BURST = float(os.environ.get("CF_RATE_BURST", "10"))
+# Largest page sizes the list endpoints accept.
+ZONES_PER_PAGE = 50
+RECORDS_PER_PAGE = 5000
+# Records per /dns_records/batch call.
+BATCH_SIZE = int(os.environ.get("CF_BATCH_SIZE", "100"))
+# Upper bound on one API call including all its retries and waits.
+REQUEST_DEADLINE = float(os.environ.get("CF_REQUEST_DEADLINE", "30"))
+MAX_ATTEMPTS = int(os.environ.get("CF_MAX_ATTEMPTS", "5"))
+# Full-jitter exponential backoff between retries.
+BACKOFF_BASE = float(os.environ.get("CF_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.environ.get("CF_BACKOFF_MAX", "10"))
+# Longest Retry-After we honour; anything above is treated as this.
+RETRY_AFTER_MAX = float(os.environ.get("CF_RETRY_AFTER_MAX", "60"))
+# Consecutive failures (5xx, network) that open an endpoint's circuit, and
+# how long it stays open before a trial call.
+BREAKER_THRESHOLD = int(os.environ.get("CF_BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN = float(os.environ.get("CF_BREAKER_COOLDOWN", "30"))
+# Send a duplicate GET once the first has taken longer than this latency
+# percentile of the endpoint (e.g. 0.95); 0 disables hedging.
+HEDGE_PERCENTILE = float(os.environ.get("CF_HEDGE_PERCENTILE", "0"))
+# How long a client replaced by a token change stays open for callers still
+# holding it (a sync cycle keeps its client for up to SYNC_CYCLE_DEADLINE); it
+# is closed after that once its in-flight calls have finished.
+RETIRE_GRACE = float(os.environ.get("CF_RETIRE_GRACE", "120"))
+
+
+def _endpoint(method: str, path: str) -> str:
+    """Collapse ids out of ``path`` so metrics get one series per endpoint."""
+    parts = path.strip("/").split("/")
+    for i in range(1, len(parts)):
+        if parts[i - 1] in ("zones", "dns_records") and parts[i] not in ("dns_records", "batch"):
+            parts[i] = ":id"
+    return f"{method} /" + "/".join(parts)
+
+
+def _api_errors(data: Dict[str, Any]) -> str:
+    messages = [err.get("message", err) if isinstance(err, dict) else err for err in data.get("errors") or []]
+    return "; ".join(str(m) for m in messages) or "unknown error"
+
+
+def _error_message(e: Exception) -> str:
+    """Short reason for a failed call, with Cloudflare's own message if it sent one."""
+    if isinstance(e, httpx.HTTPStatusError):
+        try:
+            return "HTTP %d: %s" % (e.response.status_code, _api_errors(e.response.json()))
+        except ValueError:
+            return "HTTP %d" % e.response.status_code
+    return str(e) or type(e).__name__
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
 class CloudflareClient:
     BASE = "https://api.cloudflare.com/client/v4"
 
-    def __init__(self, token: str, timeout: float = 10.0):
+    def __init__(
+        self,
+        token: str,
+        timeout: float = 10.0,
+        limits: Optional[httpx.Limits] = None,
+        http2: bool = False,
+        rate_limiter: Optional[TokenBucket] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        breakers: Optional[CircuitBreakers] = None,
+        deadline: Optional[float] = REQUEST_DEADLINE,
+        hedge_percentile: float = HEDGE_PERCENTILE,
+    ):
         self.token = token
         self.timeout = timeout
-        self._client = httpx.AsyncClient(timeout=self.timeout)
+        self.rate_limiter = rate_limiter
+        self.breakers = breakers or CircuitBreakers(BREAKER_THRESHOLD, BREAKER_COOLDOWN)
+        self.deadline = deadline
+        self.hedge_percentile = hedge_percentile
+        self._latency: Dict[str, LatencyWindow] = {}
+        if limits is None:
+            limits = httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            )
+        if http2 and not _http2_available():
+            logger.warning("HTTP/2 requested but the 'h2' package is not installed; using HTTP/1.1")
+            http2 = False
+        self._client = httpx.AsyncClient(timeout=self.timeout, limits=limits, http2=http2, transport=transport)
+        self._closed = False
+        self._inflight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def _request(self, method: str, path: str, deadline: Optional[float] = None, **kwargs) -> Dict[str, Any]:
+        """Call the API with retries, bounded by ``deadline`` seconds (default
+        ``self.deadline``) and by any enclosing ``resilience.deadline``.
 
-    async def _request(self, method: str, path: str, **kwargs) -> Dict[str, Any]:
+        Raises ``CircuitOpenError`` without calling out while the endpoint's
+        circuit is open and ``DeadlineExceeded`` when the time is up.
+        """
+        self._acquire()
+        try:
+            return await self._call(method, path, deadline, **kwargs)
+        finally:
+            self._release()
+
+    def _acquire(self):
+        self._inflight += 1
+        self._idle.clear()
+
+    def _release(self):
+        self._inflight -= 1
+        if not self._inflight:
+            self._idle.set()
+
+    async def _call(self, method: str, path: str, deadline: Optional[float], **kwargs) -> Dict[str, Any]:
         url = f"{self.BASE}{path}"
         headers = kwargs.pop("headers", {})
         headers.update({"Authorization": f"Bearer {self.token}", "Content-Type": "application/json"})
-        backoff = 1.0
-        logger.debug(f"CF API Request: {method} {path}")
-        for attempt in range(5):
+        endpoint = _endpoint(method, path)
+        breaker = self.breakers.get(endpoint)
+        until = deadline_at(deadline if deadline is not None else self.deadline)
+        hedge = method == "GET" and self.hedge_percentile > 0
+        logger.debug("CF API Request: %s %s", method, path)
+        for attempt in range(MAX_ATTEMPTS):
+            if not breaker.allow():
+                metrics.CF_FAST_FAILURES.inc(endpoint=endpoint, reason="circuit_open")
+                raise CircuitOpenError("%s: circuit open, retry in %.0fs" % (endpoint, breaker.retry_in()))
+            last = attempt == MAX_ATTEMPTS - 1
             try:
-                resp = await self._client.request(method, url, headers=headers, **kwargs)
-                logger.debug(f"CF API Response: {resp.status_code}")
-                if resp.status_code == 429:
-                    # rate-limited
-                    retry = int(resp.headers.get("Retry-After", backoff))
-                    logger.warning(f"Rate limited, retrying after {retry}s")
-                    await asyncio.sleep(retry)
-                    backoff = min(backoff * 2, 60)
-                    continue
-                resp.raise_for_status()
-                data = resp.json()
-                logger.debug(f"CF API Response JSON: {data}")
-                if not data.get("success", True):
-                    logger.error(f"Cloudflare API error: {data.get('errors', [])}")
-                return data
-            except httpx.HTTPStatusError as e:
-                logger.error(f"HTTP Error {e.response.status_code}: {e.response.text}")
-                if 500 <= e.response.status_code < 600:
-                    await asyncio.sleep(backoff)
-                    backoff = min(backoff * 2, 60)
-                    continue
-                # For 4xx errors, print full response for debugging
-                logger.error(f"Response body: {e.response.json()}")
-                raise
+                if hedge:
+                    resp = await self._send_hedged(method, url, endpoint, headers, until, **kwargs)
+                else:
+                    resp = await self._send(method, url, endpoint, headers, until, **kwargs)
             except httpx.RequestError as e:
-                logger.error(f"Request error: {e}")
-                await asyncio.sleep(backoff)
-                backoff = min(backoff * 2, 60)
+                logger.error("Request error on %s %s: %s", method, path, e)
+                self._failed(breaker, endpoint)
+                if last:
+                    break
+                metrics.CF_RETRIES.inc(endpoint=endpoint, reason="network")
+                await self._backoff(attempt, until, endpoint)
+                continue
+            logger.debug("CF API Response: %s", resp.status_code)
+            if resp.status_code == 429:
+                # the upstream is healthy, just busy: not a breaker failure
+                breaker.success()
+                metrics.CF_RATE_LIMITED.inc(endpoint=endpoint)
+                try:
+                    retry = float(resp.headers.get("Retry-After", ""))
+                except ValueError:
+                    retry = None
+                retry = min(retry, RETRY_AFTER_MAX) if retry is not None and retry >= 0 else None
+                logger.warning("Rate limited on %s, retrying after %ss", endpoint, retry)
+                if self.rate_limiter is not None and retry:
+                    # hold back every worker sharing the limiter, not just this one
+                    self.rate_limiter.pause(retry)
+                left = remaining(until)
+                if retry and left is not None and retry >= left:
+                    metrics.CF_FAST_FAILURES.inc(endpoint=endpoint, reason="deadline")
+                    raise DeadlineExceeded("%s: Retry-After %.0fs is past the deadline" % (endpoint, retry))
+                if self.rate_limiter is not None and retry:
+                    retry = 0.0  # the paused limiter does the waiting
+                if last:
+                    break
+                metrics.CF_RETRIES.inc(endpoint=endpoint, reason="429")
+                await self._backoff(attempt, until, endpoint, retry)
                 continue
+            if resp.status_code >= 500:
+                logger.error("HTTP Error %s on %s %s: %.500s", resp.status_code, method, path, resp.text)
+                self._failed(breaker, endpoint)
+                if last:
+                    break
+                metrics.CF_RETRIES.inc(endpoint=endpoint, reason="5xx")
+                await self._backoff(attempt, until, endpoint)
+                continue
+            breaker.success()
+            if resp.status_code >= 400:
+                logger.error("HTTP Error %s on %s %s: %.500s", resp.status_code, method, path, resp.text)
+                resp.raise_for_status()
+            data = resp.json()
+            if logger.isEnabledFor(logging.DEBUG):
+                info = data.get("result_info") or {}
+                logger.debug("CF API %s %s: success=%s page=%s/%s", method, path, data.get("success"),
+                             info.get("page"), info.get("total_pages"))
+            if not data.get("success", True):
+                logger.error("Cloudflare API error: %s", data.get('errors', []))
+            return data
         raise RuntimeError("Cloudflare request failed after retries")
 
-    async def list_zones(self) -> List[Dict[str, Any]]:
-        data = await self._request("GET", "/zones")
-        return data.get("result", [])
+    def _failed(self, breaker, endpoint: str):
+        if breaker.failure():
+            metrics.CF_CIRCUIT_OPENED.inc(endpoint=endpoint)
+            logger.warning("Circuit for %s opened after %d failures", endpoint, breaker.failures)
+
+    async def _backoff(self, attempt: int, until: Optional[float], endpoint: str, delay: Optional[float] = None):
+        if delay is None:
+            delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+        left = remaining(until)
+        if left is not None and delay >= left:
+            metrics.CF_FAST_FAILURES.inc(endpoint=endpoint, reason="deadline")
+            raise DeadlineExceeded("%s: no time left to retry" % endpoint)
+        await asyncio.sleep(delay)
+
+    async def _send(self, method: str, url: str, endpoint: str, headers: Dict[str, str], until: Optional[float], **kwargs) -> httpx.Response:
+        """One HTTP exchange, waiting for the rate limiter, within ``until``."""
+        left = remaining(until)
+        if left is not None and left <= 0:
+            metrics.CF_FAST_FAILURES.inc(endpoint=endpoint, reason="deadline")
+            raise DeadlineExceeded("%s: deadline passed" % endpoint)
+        if self.rate_limiter is not None:
+            # another caller's 429 may have paused the limiter past our deadline
+            if left is not None and self.rate_limiter.paused_for() >= left:
+                metrics.CF_FAST_FAILURES.inc(endpoint=endpoint, reason="deadline")
+                raise DeadlineExceeded("%s: rate limiter paused past the deadline" % endpoint)
+            try:
+                await asyncio.wait_for(self.rate_limiter.acquire(), left)
+            except asyncio.TimeoutError:
+                metrics.CF_FAST_FAILURES.inc(endpoint=endpoint, reason="deadline")
+                raise DeadlineExceeded("%s: deadline passed waiting for the rate limiter" % endpoint) from None
+            left = remaining(until)
+        timeout = self.timeout if left is None else max(0.001, min(self.timeout, left))
+        started = time.perf_counter()
+        try:
+            resp = await self._client.request(method, url, headers=headers, timeout=timeout, **kwargs)
+        except httpx.RequestError:
+            metrics.CF_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint, status="error")
+            raise
+        elapsed = time.perf_counter() - started
+        metrics.CF_REQUEST_SECONDS.observe(elapsed, endpoint=endpoint, status=resp.status_code)
+        window = self._latency.get(endpoint)
+        if window is None:
+            window = self._latency[endpoint] = LatencyWindow()
+        window.add(elapsed)
+        return resp
 
-    async def list_records(self, zone_id: str, record_type: Optional[str] = None) -> List[Dict[str, Any]]:
+    async def _send_hedged(self, method: str, url: str, endpoint: str, headers: Dict[str, str], until: Optional[float], **kwargs) -> httpx.Response:
+        """``_send``, plus a duplicate request if the first one is slower than
+        usual; whichever answers first wins. Only used for idempotent GETs."""
+        window = self._latency.get(endpoint)
+        delay = window.percentile(self.hedge_percentile) if window is not None else None
+        if delay is None:
+            return await self._send(method, url, endpoint, headers, until, **kwargs)
+        first = asyncio.ensure_future(self._send(method, url, endpoint, headers, until, **kwargs))
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+        metrics.CF_HEDGED.inc(endpoint=endpoint, result="sent")
+        second = asyncio.ensure_future(self._send(method, url, endpoint, headers, until, **kwargs))
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            metrics.CF_HEDGED.inc(endpoint=endpoint, result="won")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _paginate(self, path: str, params: Optional[Dict[str, Any]] = None, per_page: int = 100, prefetch: bool = False) -> AsyncIterator[Dict[str, Any]]:
+        """Yield every item of a paginated list endpoint, following ``result_info``.
+
+        With ``prefetch`` the next page is requested while the caller is still
+        consuming the current one.
+        """
+        params = dict(params or {}, per_page=per_page)
+        page = 1
+        next_page = None
+        # in use between pages too, so a retired client isn't closed mid-listing
+        self._acquire()
+        try:
+            data = await self._request("GET", path, params=dict(params, page=page))
+            while True:
+                info = data.get("result_info") or {}
+                more = page < (info.get("total_pages") or page)
+                if more and prefetch:
+                    next_page = asyncio.ensure_future(self._request("GET", path, params=dict(params, page=page + 1)))
+                for item in data.get("result") or []:
+                    yield item
+                if not more:
+                    return
+                page += 1
+                if next_page is not None:
+                    data, next_page = await next_page, None
+                else:
+                    data = await self._request("GET", path, params=dict(params, page=page))
+        finally:
+            if next_page is not None:
+                next_page.cancel()
+            self._release()
+
+    def iter_zones(self, prefetch: bool = False) -> AsyncIterator[Dict[str, Any]]:
+        return self._paginate("/zones", per_page=ZONES_PER_PAGE, prefetch=prefetch)
+
+    async def iter_records(self, zone_id: str, types: Optional[Iterable[str]] = None, prefetch: bool = False) -> AsyncIterator[Dict[str, Any]]:
+        """Yield the records of a zone, optionally limited to ``types``.
+
+        The API filters on a single type only, so several types are fetched in
+        one unfiltered listing and filtered here rather than one listing each.
+        """
+        wanted = set(types) if types else None
         params = {}
+        if wanted and len(wanted) == 1:
+            params["type"] = next(iter(wanted))
+        async for rec in self._paginate(f"/zones/{zone_id}/dns_records", params, per_page=RECORDS_PER_PAGE, prefetch=prefetch):
+            if wanted is None or rec.get("type") in wanted:
+                yield rec
+
+    async def list_zones(self) -> List[Dict[str, Any]]:
+        return [zone async for zone in self.iter_zones(prefetch=True)]
+
+    async def list_records(self, zone_id: str, record_type: Optional[str] = None, types: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
         if record_type:
-            params["type"] = record_type
-        data = await self._request("GET", f"/zones/{zone_id}/dns_records", params=params)
-        return data.get("result", [])
+            types = [record_type]
+        return [rec async for rec in self.iter_records(zone_id, types=types, prefetch=True)]
 
     async def update_record(self, zone_id: str, record_id: str, content: str, name: Optional[str] = None, record_type: Optional[str] = None) -> Dict[str, Any]:
         payload = {"content": content}
@@ -73,25 +352,178 @@ class CloudflareClient:
         data = await self._request("PUT", f"/zones/{zone_id}/dns_records/{record_id}", json=payload)
         return data.get("result", {})
 
+    async def patch_record(self, zone_id: str, record_id: str, fields: Dict[str, Any]) -> Dict[str, Any]:
+        data = await self._request("PATCH", f"/zones/{zone_id}/dns_records/{record_id}", json=fields)
+        return data.get("result", {})
+
+    async def batch_update_records(
+        self, zone_id: str, patches: List[Dict[str, Any]], chunk_size: int = BATCH_SIZE,
+    ) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, str]]:
+        """Apply ``patches`` (each an ``id`` plus the fields to change) through
+        Cloudflare's batch endpoint, ``chunk_size`` records per call.
+
+        A failed chunk is retried record by record. Returns ``(updated,
+        errors)``: the updated records keyed by id, and why each of the other
+        ids could not be updated.
+        """
+        updated: Dict[str, Dict[str, Any]] = {}
+        errors: Dict[str, str] = {}
+        chunk_size = max(1, chunk_size)
+        for start in range(0, len(patches), chunk_size):
+            chunk = patches[start:start + chunk_size]
+            try:
+                data = await self._request("POST", f"/zones/{zone_id}/dns_records/batch", json={"patches": chunk})
+                if not data.get("success", True):
+                    raise RuntimeError(f"batch rejected: {data.get('errors', [])}")
+                for rec in (data.get("result") or {}).get("patches", []):
+                    updated[rec.get("id")] = rec
+                for patch in chunk:
+                    if patch["id"] not in updated:
+                        errors[patch["id"]] = "missing from the batch result"
+                continue
+            except (CircuitOpenError, DeadlineExceeded) as e:
+                # single updates would fail the same way, and so would the next chunks
+                for patch in patches[start:]:
+                    errors[patch["id"]] = str(e)
+                break
+            except Exception as e:
+                logger.warning("Batch update of %s records in zone %s failed, falling back to single updates: %s", len(chunk), zone_id, e)
+            for patch in chunk:
+                fields = {k: v for k, v in patch.items() if k != "id"}
+                try:
+                    data = await self._request("PATCH", f"/zones/{zone_id}/dns_records/{patch['id']}", json=fields)
+                    if data.get("success", True):
+                        updated[patch["id"]] = data.get("result", {})
+                    else:
+                        errors[patch["id"]] = "rejected: %s" % _api_errors(data)
+                except Exception as e:
+                    logger.error("Failed to update record %s in zone %s: %s", patch['id'], zone_id, e)
+                    errors[patch["id"]] = _error_message(e)
+        return updated, errors
+
     async def get_record(self, zone_id: str, record_id: str) -> Dict[str, Any]:
-        logger.info(f"Fetching record {record_id} from zone {zone_id}")
+        logger.info("Fetching record %s from zone %s", record_id, zone_id)
         data = await self._request("GET", f"/zones/{zone_id}/dns_records/{record_id}")
         return data.get("result", {})
 
     async def update_record_proxy(self, zone_id: str, record_id: str, proxied: bool) -> Dict[str, Any]:
-        # Fetch current record to get all required fields for update
-        current_record = await self.get_record(zone_id, record_id)
-        # Send ALL required fields according to Cloudflare API documentation
-        payload = {
-            "type": current_record.get("type"),
-            "name": current_record.get("name"),
-            "content": current_record.get("content"),
-            "ttl": current_record.get("ttl", 3600),
-            "proxied": proxied
-        }
-        logger.info(f"Updating proxy for record {record_id} ({current_record.get('name')}): proxied={proxied}")
-        data = await self._request("PUT", f"/zones/{zone_id}/dns_records/{record_id}", json=payload)
-        return data.get("result", {})
+        # PATCH only touches the given field, so no need to fetch the record first
+        logger.info("Updating proxy for record %s: proxied=%s", record_id, proxied)
+        return await self.patch_record(zone_id, record_id, {"proxied": proxied})
+
+    async def retire(self, grace: float = RETIRE_GRACE):
+        """Close after ``grace`` seconds, once no call is in flight."""
+        try:
+            await asyncio.sleep(grace)
+            await self._idle.wait()
+        finally:
+            await self.close()
 
     async def close(self):
+        if self._closed:
+            return
+        self._closed = True
         await self._client.aclose()
+
+
+class CloudflareClientManager:
+    """Owns the app-wide CloudflareClient so every caller shares one connection pool.
+
+    The client is created lazily from ``token_loader`` and kept until the token
+    changes or the app shuts down (``close``). A token saved by another worker
+    is picked up on the next ``get``; ``rebuild`` forces it. A replaced client
+    is retired rather than closed, so requests and sync cycles still using it
+    can finish.
+    """
+
+    def __init__(self, token_loader: Callable[[], Optional[str]], retire_grace: float = RETIRE_GRACE, **client_kwargs):
+        self._token_loader = token_loader
+        self._retire_grace = retire_grace
+        self._retiring: set = set()
+        client_kwargs.setdefault("http2", HTTP2)
+        # one bucket and one set of breakers per manager so they survive token rebuilds
+        client_kwargs.setdefault("rate_limiter", TokenBucket(RATE_LIMIT, RATE_BURST))
+        client_kwargs.setdefault("breakers", CircuitBreakers(BREAKER_THRESHOLD, BREAKER_COOLDOWN))
+        self._client_kwargs = client_kwargs
+        self._client: Optional[CloudflareClient] = None
+        self._lock = asyncio.Lock()
+
+    async def get(self) -> Optional[CloudflareClient]:
+        client = self._client
+        if client is not None and client.token == self._token_loader():
+            return client
+        async with self._lock:
+            # another caller may have built it while we waited for the lock
+            token = self._token_loader()
+            if self._client is None or self._client.token != token:
+                self._replace(token)
+            return self._client
+
+    async def rebuild(self):
+        """Drop the current client and build a new one from the latest token."""
+        async with self._lock:
+            self._replace(self._token_loader())
+
+    def _replace(self, token: Optional[str]):
+        old, self._client = self._client, None
+        if token:
+            self._client = CloudflareClient(token, **self._client_kwargs)
+        if old is not None:
+            task = asyncio.ensure_future(old.retire(self._retire_grace))
+            self._retiring.add(task)
+            task.add_done_callback(self._retiring.discard)
+
+    async def close(self):
+        async with self._lock:
+            old, self._client = self._client, None
+        if old is not None:
+            await old.close()
+        # shutting down: don't wait out the grace period of retired clients
+        retiring = list(self._retiring)
+        for task in retiring:
+            task.cancel()
+        await asyncio.gather(*retiring, return_exceptions=True)
+
+
+class CloudflareAccounts:
+    """One ``CloudflareClientManager`` per account, created on first use.
+
+    Each manager has its own connection pool and rate limiter, so one account
+    being throttled or failing never holds back another. Managers passed to
+    ``add`` are shared with someone else and are not closed here.
+    """
+
+    def __init__(self, token_loader: Callable[[str], Optional[str]], **client_kwargs):
+        self._token_loader = token_loader
+        self._client_kwargs = client_kwargs
+        self._managers: Dict[str, CloudflareClientManager] = {}
+        self._shared: set = set()
+
+    def add(self, account: str, manager: CloudflareClientManager):
+        self._managers[account] = manager
+        self._shared.add(account)
+
+    def manager(self, account: str) -> CloudflareClientManager:
+        manager = self._managers.get(account)
+        if manager is None:
+            manager = self._managers[account] = CloudflareClientManager(
+                lambda: self._token_loader(account), **self._client_kwargs
+            )
+        return manager
+
+    async def get(self, account: str) -> Optional[CloudflareClient]:
+        return await self.manager(account).get()
+
+    async def rebuild(self, account: str):
+        await self.manager(account).rebuild()
+
+    async def discard(self, account: str):
+        """Close and forget an account's client (e.g. after it was removed)."""
+        manager = self._managers.pop(account, None)
+        if manager is not None and account not in self._shared:
+            await manager.close()
+        self._shared.discard(account)
+
+    async def close(self):
+        for account in list(self._managers):
+            await self.discard(account)
@@ -1,53 +1,137 @@
+import atexit
+import bisect
+import copy
 import json
 import os
 import base64
 import hashlib
-from typing import Any, Dict, Optional
+import threading
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .storage import WRITE_DELAY, StorageBackend, make_storage
 
 DATA_DIR = os.environ.get("DATA_DIR", "/data")
 CONFIG_PATH = os.path.join(DATA_DIR, "config.json")
 RECORDS_PATH = os.path.join(DATA_DIR, "records.json")
 
+# Records without an "account" belong here; its token is the original
+# top-level ``token_encrypted`` so single-account installs keep working.
+DEFAULT_ACCOUNT = "default"
+# Other accounts' tokens are stored one setting each, so workers adding or
+# removing different accounts at the same time don't overwrite each other.
+ACCOUNT_SETTING_PREFIX = "account:"
+
+
+def account_of(record: Dict[str, Any]) -> str:
+    return record.get("account") or DEFAULT_ACCOUNT
+
+
+RECORD_SORT_FIELDS = ("name", "type", "zone_id", "content", "auto_update", "account")
+
+
+def _sort_value(record: Dict[str, Any], field: str) -> str:
+    if field == "auto_update":
+        return "1" if record.get("auto_update") else "0"
+    if field == "account":
+        return account_of(record)
+    return str(record.get(field) or "").lower()
+
+
+def encode_cursor(value: str, key: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([value, key]).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        value, key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return str(value), str(key)
+    except (ValueError, TypeError) as e:
+        raise ValueError("invalid cursor") from e
+
 
 class ConfigManager:
-    def __init__(self, secret: Optional[str] = None):
-        self.config_path = CONFIG_PATH
-        self.records_path = RECORDS_PATH
+    """Parsed, indexed view of the stored config and records.
+
+    Reads are served from memory; records are indexed by ``record_id`` and by
+    zone. Every change is handed to the storage backend (JSON files or
+    SQLite, see ``app.storage``); call ``flush`` before exit to force pending
+    writes out.
+    """
+
+    def __init__(
+        self,
+        secret: Optional[str] = None,
+        data_dir: Optional[str] = None,
+        write_delay: float = WRITE_DELAY,
+        storage: Optional[StorageBackend] = None,
+    ):
+        data_dir = data_dir or DATA_DIR
+        self.data_dir = data_dir
+        self.config_path = os.path.join(data_dir, "config.json")
+        self.records_path = os.path.join(data_dir, "records.json")
         self.secret = secret
-        os.makedirs(DATA_DIR, exist_ok=True)
-        if not os.path.exists(self.config_path):
-            self._write_json(self.config_path, {"token_encrypted": None, "settings": {}})
-        if not os.path.exists(self.records_path):
-            self._write_json(self.records_path, {"records": []})
+        self._lock = threading.RLock()
+        self.storage = storage or make_storage(data_dir, write_delay=write_delay)
+        self.storage.attach(self._config_snapshot, self._records_snapshot)
+        self._config, records = self.storage.load()
+        self._records: Dict[str, Dict[str, Any]] = {}
+        self._by_zone: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # bumped on every record change; with ``instance_id`` it makes an ETag
+        self.revision = 0
+        self.instance_id = uuid.uuid4().hex[:8]
+        self._sorted: Dict[str, Tuple[int, List[Tuple[str, str]]]] = {}
+        self._load_records(records)
+        atexit.register(self.flush)
 
-    def _write_json(self, path: str, data: Dict[str, Any]):
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2)
+    def _config_snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return copy.deepcopy(self._config)
 
-    def _read_json(self, path: str) -> Dict[str, Any]:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+    def _records_snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"records": [dict(r) for r in self._records.values()]}
 
-    def save_token(self, token: str):
+    def flush(self):
+        """Write any pending changes to disk now."""
+        self.storage.flush()
+
+    def refresh(self) -> bool:
+        """Reload from storage if another process changed it since we loaded."""
+        if not self.storage.changed():
+            return False
+        config, records = self.storage.load()
+        with self._lock:
+            self._config = config
+            self._load_records(records)
+        return True
+
+    def save_token(self, token: str, account: str = DEFAULT_ACCOUNT):
         payload = token
         if self.secret:
             payload = self._obfuscate(token)
-        cfg = self._read_json(self.config_path)
-        cfg["token_encrypted"] = payload
-        self._write_json(self.config_path, cfg)
+        with self._lock:
+            if account == DEFAULT_ACCOUNT:
+                self._config["token_encrypted"] = payload
+                self.storage.put_setting("token_encrypted", payload)
+            else:
+                key = ACCOUNT_SETTING_PREFIX + account
+                self._config["settings"][key] = payload
+                self.storage.put_setting(key, payload)
 
     def save_polling_interval(self, interval: int):
-        cfg = self._read_json(self.config_path)
-        cfg["settings"]["polling_interval"] = interval
-        self._write_json(self.config_path, cfg)
+        with self._lock:
+            self._config["settings"]["polling_interval"] = interval
+            self.storage.put_setting("polling_interval", interval)
 
     def load_polling_interval(self) -> int:
-        cfg = self._read_json(self.config_path)
-        return cfg.get("settings", {}).get("polling_interval", 300)
+        return self._config.get("settings", {}).get("polling_interval", 300)
 
-    def load_token(self) -> Optional[str]:
-        cfg = self._read_json(self.config_path)
-        tok = cfg.get("token_encrypted")
+    def load_token(self, account: str = DEFAULT_ACCOUNT) -> Optional[str]:
+        if account == DEFAULT_ACCOUNT:
+            tok = self._config.get("token_encrypted")
+        else:
+            tok = self._config.get("settings", {}).get(ACCOUNT_SETTING_PREFIX + account)
         if not tok:
             return None
         if self.secret:
@@ -60,11 +144,178 @@ class ConfigManager:
                 return tok
         return tok
 
-    def save_records(self, records: Dict[str, Any]):
-        self._write_json(self.records_path, records)
+    def list_accounts(self) -> List[str]:
+        """Names of the accounts that have a token, the default one first."""
+        names = [
+            key[len(ACCOUNT_SETTING_PREFIX):]
+            for key, value in self._config.get("settings", {}).items()
+            if key.startswith(ACCOUNT_SETTING_PREFIX) and value
+        ]
+        if self._config.get("token_encrypted"):
+            names.insert(0, DEFAULT_ACCOUNT)
+        return names
+
+    def delete_account(self, account: str) -> bool:
+        """Forget an account's token; its records are left alone."""
+        with self._lock:
+            if account == DEFAULT_ACCOUNT:
+                if not self._config.get("token_encrypted"):
+                    return False
+                self._config["token_encrypted"] = None
+                self.storage.put_setting("token_encrypted", None)
+                return True
+            key = ACCOUNT_SETTING_PREFIX + account
+            if self._config["settings"].pop(key, None) is None:
+                return False
+            self.storage.delete_setting(key)
+        return True
+
+    # -- records -----------------------------------------------------------
+
+    def _load_records(self, records: Iterable[Tuple[str, Dict[str, Any]]]):
+        self.revision += 1
+        self._records = {}
+        self._by_zone = {}
+        for key, rec in records:
+            self._index(dict(rec), key)
+
+    def _index(self, rec: Dict[str, Any], key: Optional[str] = None) -> str:
+        # records without a record_id get their key once, when added; the
+        # storage backend hands it back on load
+        key = key or rec.get("record_id") or uuid.uuid4().hex
+        old = self._records.get(key)
+        if old is not None:
+            self._by_zone.get(old.get("zone_id"), {}).pop(key, None)
+        self._records[key] = rec
+        self._by_zone.setdefault(rec.get("zone_id"), {})[key] = rec
+        return key
 
     def load_records(self) -> Dict[str, Any]:
-        return self._read_json(self.records_path)
+        # copies, so callers can't change the index behind our back
+        return self._records_snapshot()
+
+    def record_count(self) -> int:
+        return len(self._records)
+
+    def has_record(self, record_id: str) -> bool:
+        return record_id in self._records
+
+    def get_record(self, record_id: str) -> Optional[Dict[str, Any]]:
+        rec = self._records.get(record_id)
+        return dict(rec) if rec is not None else None
+
+    def records_for_account(self, account: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(r) for r in self._records.values() if account_of(r) == account]
+
+    def zone_ids(self) -> List[str]:
+        with self._lock:
+            return sorted(z for z, recs in self._by_zone.items() if z and recs)
+
+    def records_for_zone(self, zone_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(r) for r in self._by_zone.get(zone_id, {}).values()]
+
+    def _sorted_keys(self, field: str) -> List[Tuple[str, str]]:
+        # (sort value, key) pairs, rebuilt only after the records change
+        cached = self._sorted.get(field)
+        if cached is None or cached[0] != self.revision:
+            pairs = sorted((_sort_value(r, field), k) for k, r in self._records.items())
+            cached = self._sorted[field] = (self.revision, pairs)
+        return cached[1]
+
+    def query_records(
+        self,
+        zone_id: Optional[str] = None,
+        name: Optional[str] = None,
+        type: Optional[str] = None,
+        auto_update: Optional[bool] = None,
+        account: Optional[str] = None,
+        sort: str = "name",
+        descending: bool = False,
+        cursor: Optional[str] = None,
+        limit: int = 100,
+    ) -> Dict[str, Any]:
+        """One page of records matching the filters, in ``sort`` order.
+
+        ``name`` matches a case-insensitive substring. Pass the returned
+        ``next_cursor`` back to get the following page; it stays valid while
+        records are added or removed.
+        """
+        if sort not in RECORD_SORT_FIELDS:
+            raise ValueError("cannot sort by %r" % sort)
+        needle = name.lower() if name else None
+
+        def matches(rec: Dict[str, Any]) -> bool:
+            return (
+                (zone_id is None or rec.get("zone_id") == zone_id)
+                and (needle is None or needle in str(rec.get("name") or "").lower())
+                and (type is None or (rec.get("type") or "A") == type.upper())
+                and (auto_update is None or bool(rec.get("auto_update")) == auto_update)
+                and (account is None or account_of(rec) == account)
+            )
+
+        with self._lock:
+            pairs = self._sorted_keys(sort)
+            if descending:
+                start = bisect.bisect_left(pairs, decode_cursor(cursor)) - 1 if cursor else len(pairs) - 1
+                positions = range(start, -1, -1)
+            else:
+                start = bisect.bisect_right(pairs, decode_cursor(cursor)) if cursor else 0
+                positions = range(start, len(pairs))
+            page: List[Dict[str, Any]] = []
+            last = None
+            more = False
+            for i in positions:
+                rec = self._records[pairs[i][1]]
+                if not matches(rec):
+                    continue
+                if len(page) == limit:
+                    more = True
+                    break
+                page.append(dict(rec))
+                last = pairs[i]
+            total = sum(1 for r in self._records.values() if matches(r))
+        return {
+            "records": page,
+            "next_cursor": encode_cursor(*last) if more and last else None,
+            "total": total,
+        }
+
+    def add_record(self, record: Dict[str, Any]):
+        self.add_records([record])
+
+    def add_records(self, records: Iterable[Dict[str, Any]]):
+        with self._lock:
+            for rec in records:
+                key = self._index(dict(rec))
+                self.storage.put_record(key, self._records[key])
+            self.revision += 1
+
+    def update_record(self, record_id: str, **fields) -> bool:
+        with self._lock:
+            rec = self._records.get(record_id)
+            if rec is None:
+                return False
+            stored = self.storage.update_record(record_id, fields, dict(rec, **fields))
+            self.revision += 1
+            if stored is None:
+                # deleted by another worker since we last loaded
+                self._records.pop(record_id, None)
+                self._by_zone.get(rec.get("zone_id"), {}).pop(record_id, None)
+                return False
+            self._index(stored, record_id)
+        return True
+
+    def delete_record(self, record_id: str) -> bool:
+        with self._lock:
+            rec = self._records.pop(record_id, None)
+            if rec is None:
+                return False
+            self._by_zone.get(rec.get("zone_id"), {}).pop(record_id, None)
+            self.storage.delete_record(record_id)
+            self.revision += 1
+        return True
 
     def _derive_key(self) -> bytes:
         # derive a repeating key from secret
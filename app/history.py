@@ -0,0 +1,203 @@
+"""Append-only history of sync cycles and record changes.
+
+One row per cycle and one per record the cycle updated or failed to update;
+records that already matched are not stored, so an idle install writes one
+small row per poll. Rows live in ``history.sqlite3`` next to the config, are
+indexed by time and by record, and are pruned by age and by row count. Only
+the sync leader writes; any worker can read.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from .storage import enable_wal
+
+logger = logging.getLogger(__name__)
+
+HISTORY_RETENTION_DAYS = float(os.environ.get("HISTORY_RETENTION_DAYS", "90"))
+# per table; the oldest rows go first
+HISTORY_MAX_ROWS = int(os.environ.get("HISTORY_MAX_ROWS", "100000"))
+# prune at most this often (seconds), so busy installs don't prune every cycle
+PRUNE_INTERVAL = 3600
+
+CHANGE_FIELDS = ("id", "ts", "job_id", "record_id", "name", "type", "account", "zone_id",
+                 "old_ip", "new_ip", "status", "latency_ms", "error")
+CYCLE_FIELDS = ("id", "ts", "job_id", "reason", "status", "duration_ms", "ip", "ipv6",
+                "updated", "skipped", "failed", "error")
+
+
+class SyncHistory:
+    def __init__(
+        self,
+        data_dir: str,
+        filename: str = "history.sqlite3",
+        retention_days: float = HISTORY_RETENTION_DAYS,
+        max_rows: int = HISTORY_MAX_ROWS,
+    ):
+        os.makedirs(data_dir, exist_ok=True)
+        self.path = os.path.join(data_dir, filename)
+        self.retention_days = retention_days
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        # must be set before the first table exists to take effect
+        self._db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        enable_wal(self._db)
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS cycles (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ts REAL NOT NULL,
+                job_id TEXT,
+                reason TEXT,
+                status TEXT NOT NULL,
+                duration_ms REAL,
+                ip TEXT,
+                ipv6 TEXT,
+                updated INTEGER NOT NULL DEFAULT 0,
+                skipped INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS cycles_ts ON cycles(ts);
+            CREATE TABLE IF NOT EXISTS changes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ts REAL NOT NULL,
+                job_id TEXT,
+                record_id TEXT NOT NULL,
+                name TEXT,
+                type TEXT,
+                account TEXT,
+                zone_id TEXT,
+                old_ip TEXT,
+                new_ip TEXT,
+                status TEXT NOT NULL,
+                latency_ms REAL,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS changes_ts ON changes(ts);
+            CREATE INDEX IF NOT EXISTS changes_record ON changes(record_id, ts);
+            """
+        )
+        self._pruned_at = 0.0
+
+    def add_cycle(self, cycle: Dict[str, Any], changes: Iterable[Dict[str, Any]] = ()):
+        """Append one cycle and its record changes in a single transaction."""
+        cycle = dict(cycle)
+        cycle.setdefault("ts", time.time())
+        for count in ("updated", "skipped", "failed"):
+            cycle.setdefault(count, 0)
+        rows = [dict(c, ts=c.get("ts", cycle["ts"]), job_id=c.get("job_id", cycle.get("job_id"))) for c in changes]
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._insert("cycles", CYCLE_FIELDS, [cycle])
+                self._insert("changes", CHANGE_FIELDS, rows)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        if time.time() - self._pruned_at >= PRUNE_INTERVAL:
+            self.prune()
+
+    def _insert(self, table: str, fields: Iterable[str], rows: List[Dict[str, Any]]):
+        if not rows:
+            return
+        columns = [f for f in fields if f != "id"]
+        self._db.executemany(
+            "INSERT INTO %s (%s) VALUES (%s)" % (table, ", ".join(columns), ", ".join("?" * len(columns))),
+            [tuple(row.get(c) for c in columns) for row in rows],
+        )
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """Drop rows past the retention window or the row cap; returns rows removed."""
+        now = now if now is not None else time.time()
+        removed = 0
+        with self._lock:
+            for table in ("cycles", "changes"):
+                if self.retention_days > 0:
+                    cur = self._db.execute("DELETE FROM %s WHERE ts < ?" % table, (now - self.retention_days * 86400,))
+                    removed += cur.rowcount
+                if self.max_rows > 0:
+                    cur = self._db.execute(
+                        "DELETE FROM %s WHERE id <= (SELECT MAX(id) FROM %s) - ?" % (table, table), (self.max_rows,)
+                    )
+                    removed += cur.rowcount
+            if removed:
+                self._db.execute("PRAGMA incremental_vacuum")
+        self._pruned_at = now
+        if removed:
+            logger.info("Pruned %d history rows", removed)
+        return removed
+
+    def _query(
+        self,
+        table: str,
+        fields: Iterable[str],
+        where: List[str],
+        args: List[Any],
+        since: Optional[float],
+        until: Optional[float],
+        cursor: Optional[str],
+        limit: int,
+    ) -> Dict[str, Any]:
+        if since is not None:
+            where.append("ts >= ?")
+            args.append(since)
+        if until is not None:
+            where.append("ts < ?")
+            args.append(until)
+        if cursor:
+            try:
+                where.append("id < ?")
+                args.append(int(cursor))
+            except ValueError as e:
+                raise ValueError("invalid cursor") from e
+        fields = list(fields)
+        sql = "SELECT %s FROM %s" % (", ".join(fields), table)
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        # ids grow with time, so newest-first by id is newest-first by ts
+        sql += " ORDER BY id DESC LIMIT ?"
+        with self._lock:
+            rows = self._db.execute(sql, args + [limit + 1]).fetchall()
+        items = [dict(zip(fields, row)) for row in rows[:limit]]
+        next_cursor = str(items[-1]["id"]) if len(rows) > limit else None
+        return {"items": items, "next_cursor": next_cursor}
+
+    def changes(
+        self,
+        record_id: Optional[str] = None,
+        status: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        cursor: Optional[str] = None,
+        limit: int = 100,
+    ) -> Dict[str, Any]:
+        """Record changes, newest first, optionally for one record or status."""
+        where, args = [], []
+        if record_id:
+            where.append("record_id = ?")
+            args.append(record_id)
+        if status:
+            where.append("status = ?")
+            args.append(status)
+        return self._query("changes", CHANGE_FIELDS, where, args, since, until, cursor, limit)
+
+    def cycles(
+        self,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        cursor: Optional[str] = None,
+        limit: int = 100,
+    ) -> Dict[str, Any]:
+        """Sync cycles, newest first."""
+        return self._query("cycles", CYCLE_FIELDS, [], [], since, until, cursor, limit)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -1,36 +1,216 @@
+import asyncio
+import ipaddress
+import logging
+import os
+import time
 import httpx
-from typing import Optional
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
 
 CF_TRACE = "https://cloudflare.com/cdn-cgi/trace"
-IPIFY = "https://api.ipify.org"
+# dual-stack hosts, so the same providers answer over either family
+IPIFY = "https://api64.ipify.org"
 IFCONFIG = "https://ifconfig.co/ip"
 
-async def detect_wan_ip(client: httpx.AsyncClient) -> Optional[str]:
-    # Try Cloudflare trace
-    try:
-        r = await client.get(CF_TRACE, timeout=5.0)
-        if r.status_code == 200:
-            text = r.text
-            for line in text.splitlines():
-                if line.startswith("ip="):
-                    return line.split("=", 1)[1].strip()
-    except Exception:
-        pass
-
-    # Fallback to ipify
-    try:
-        r = await client.get(IPIFY, timeout=5.0)
-        if r.status_code == 200:
-            return r.text.strip()
-    except Exception:
-        pass
+# How long a detected IP is reused before the providers are asked again.
+IP_CACHE_TTL = float(os.environ.get("IP_CACHE_TTL", "60"))
+# Number of providers that must agree before an answer is accepted.
+IP_QUORUM = int(os.environ.get("IP_QUORUM", "1"))
+# Address families to detect, each over a transport bound to that family.
+IP_FAMILIES = tuple(int(f) for f in os.environ.get("IP_FAMILIES", "4,6").split(",") if f.strip() in ("4", "6"))
+PROVIDER_TIMEOUT = 5.0
+
+# source address that pins a client's sockets to one family
+FAMILY_LOCAL_ADDRESS = {4: "0.0.0.0", 6: "::"}
 
-    # Fallback to ifconfig.co
+Provider = Callable[[httpx.AsyncClient], Awaitable[Optional[str]]]
+
+
+def _clean_ip(text: str) -> Optional[str]:
     try:
-        r = await client.get(IFCONFIG, timeout=5.0, headers={"Accept": "text/plain"})
-        if r.status_code == 200:
-            return r.text.strip()
-    except Exception:
-        pass
+        return str(ipaddress.ip_address(text.strip()))
+    except ValueError:
+        return None
+
+
+async def _from_trace(client: httpx.AsyncClient) -> Optional[str]:
+    r = await client.get(CF_TRACE, timeout=PROVIDER_TIMEOUT)
+    if r.status_code == 200:
+        for line in r.text.splitlines():
+            if line.startswith("ip="):
+                return _clean_ip(line.split("=", 1)[1])
+    return None
+
+
+async def _from_ipify(client: httpx.AsyncClient) -> Optional[str]:
+    r = await client.get(IPIFY, timeout=PROVIDER_TIMEOUT)
+    if r.status_code == 200:
+        return _clean_ip(r.text)
+    return None
+
+
+async def _from_ifconfig(client: httpx.AsyncClient) -> Optional[str]:
+    r = await client.get(IFCONFIG, timeout=PROVIDER_TIMEOUT, headers={"Accept": "text/plain"})
+    if r.status_code == 200:
+        return _clean_ip(r.text)
+    return None
+
+
+PROVIDERS: List[Tuple[str, Provider]] = [
+    ("cloudflare", _from_trace),
+    ("ipify", _from_ipify),
+    ("ifconfig", _from_ifconfig),
+]
+
+
+def family_client(family: int, **kwargs) -> httpx.AsyncClient:
+    """A client whose connections only use IPv4 (``family=4``) or IPv6 (6)."""
+    return httpx.AsyncClient(transport=httpx.AsyncHTTPTransport(local_address=FAMILY_LOCAL_ADDRESS[family]), **kwargs)
+
 
+def ip_family(ip: Optional[str]) -> Optional[int]:
+    return ipaddress.ip_address(ip).version if ip else None
+
+
+async def race_providers(
+    client: httpx.AsyncClient,
+    providers: List[Tuple[str, Provider]] = PROVIDERS,
+    quorum: int = 1,
+    family: Optional[int] = None,
+) -> Optional[str]:
+    """Query every provider at once and return the first IP reported by
+    ``quorum`` of them; the remaining lookups are cancelled. With ``family``
+    answers of the other family don't count."""
+
+    async def ask(name: str, provider: Provider) -> Optional[str]:
+        started = time.perf_counter()
+        result = "error"
+        try:
+            ip = await provider(client)
+            if ip and family and ip_family(ip) != family:
+                ip = None
+            result = "ok" if ip else "empty"
+            return ip
+        except asyncio.CancelledError:
+            result = "cancelled"
+            raise
+        except Exception as e:
+            logger.debug("IP provider %s failed: %s", name, e)
+            return None
+        finally:
+            metrics.IP_PROVIDER_SECONDS.observe(
+                time.perf_counter() - started, provider=name, result=result, family="ipv%d" % family if family else "any",
+            )
+
+    tasks = [asyncio.ensure_future(ask(name, provider)) for name, provider in providers]
+    votes: Dict[str, int] = {}
+    try:
+        for done in asyncio.as_completed(tasks):
+            ip = await done
+            if not ip:
+                continue
+            votes[ip] = votes.get(ip, 0) + 1
+            if votes[ip] >= quorum:
+                return ip
+    finally:
+        for task in tasks:
+            task.cancel()
+    if votes:
+        logger.warning("WAN IP providers disagree, no quorum of %d: %s", quorum, votes)
     return None
+
+
+def primary_ip(addresses: Dict[int, Optional[str]]) -> Optional[str]:
+    """The address to show when only one fits: IPv4 if there is one."""
+    return addresses.get(4) or addresses.get(6)
+
+
+async def detect_wan_ip(client: httpx.AsyncClient) -> Optional[str]:
+    return await race_providers(client)
+
+
+class WanIpDetector:
+    """Shared, cached WAN address lookup for IPv4 and IPv6.
+
+    Each family is probed concurrently over its own family-bound client, so
+    a host with both gets both, and a family without connectivity just comes
+    back empty. Answers are reused for ``ttl`` seconds and concurrent callers
+    share one in-flight lookup, so status polling and the sync loop cost at
+    most one round of provider requests per TTL.
+
+    A single ``client`` that isn't bound to a family is raced once and its
+    answer filed under whatever family it has.
+    """
+
+    def __init__(
+        self,
+        client: Optional[httpx.AsyncClient] = None,
+        providers: Optional[List[Tuple[str, Provider]]] = None,
+        ttl: float = IP_CACHE_TTL,
+        quorum: int = IP_QUORUM,
+        families: Tuple[int, ...] = IP_FAMILIES,
+        clients: Optional[Dict[int, httpx.AsyncClient]] = None,
+    ):
+        self._client = client
+        self._clients: Dict[int, httpx.AsyncClient] = dict(clients or {})
+        self._owns_clients = client is None and clients is None
+        self.families = tuple(clients) if clients else (families or (4,))
+        self.providers = providers or PROVIDERS
+        self.ttl = ttl
+        self.quorum = max(1, min(quorum, len(self.providers)))
+        self._addresses: Dict[int, Optional[str]] = {}
+        self._checked_at = 0.0
+        self._generation = 0
+        self._inflight: Optional[asyncio.Future] = None
+
+    @property
+    def cached_ip(self) -> Optional[str]:
+        return primary_ip(self._addresses)
+
+    @property
+    def cached_addresses(self) -> Dict[int, Optional[str]]:
+        return dict(self._addresses)
+
+    def invalidate(self):
+        # a lookup already in flight may predate the change: don't reuse or cache it
+        self._checked_at = 0.0
+        self._generation += 1
+        self._inflight = None
+
+    async def get(self, force: bool = False) -> Optional[str]:
+        """The primary WAN address (IPv4 if there is one)."""
+        return primary_ip(await self.get_addresses(force))
+
+    async def get_addresses(self, force: bool = False) -> Dict[int, Optional[str]]:
+        """WAN address per family, ``{4: ..., 6: ...}``; None where undetected."""
+        if not force and any(self._addresses.values()) and time.monotonic() - self._checked_at < self.ttl:
+            return dict(self._addresses)
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.ensure_future(self._refresh(self._generation))
+        return dict(await asyncio.shield(self._inflight))
+
+    async def _refresh(self, generation: int) -> Dict[int, Optional[str]]:
+        if self._client is not None:
+            ip = await race_providers(self._client, self.providers, self.quorum)
+            addresses = {family: ip if ip_family(ip) == family else None for family in self.families}
+        else:
+            for family in self.families:
+                if family not in self._clients:
+                    self._clients[family] = family_client(family)
+            found = await asyncio.gather(*(
+                race_providers(self._clients[family], self.providers, self.quorum, family) for family in self.families
+            ))
+            addresses = dict(zip(self.families, found))
+        if any(addresses.values()) and generation == self._generation:
+            self._addresses = addresses
+            self._checked_at = time.monotonic()
+        return addresses
+
+    async def close(self):
+        if self._owns_clients:
+            for client in self._clients.values():
+                await client.aclose()
+            self._clients = {}
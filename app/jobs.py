@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SyncJob:
+    """One sync run, with progress and per-record results for status polling."""
+
+    def __init__(self, reason: str, key: Optional[str] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.reason = reason
+        self.key = key
+        self.status = "running"
+        self.message: Optional[str] = None
+        self.error: Optional[str] = None
+        self.ip: Optional[str] = None
+        self.ipv6: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.total = 0
+        self.done = 0
+        self.results: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, record_id: str, name: Optional[str], status: str, error: Optional[str] = None, **detail):
+        # ``detail`` (e.g. latency_ms) is kept for the sync history
+        self.results[record_id] = dict(detail, name=name, status=status, error=error)
+        if status != "skipped":
+            self.done += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "reason": self.reason,
+            "key": self.key,
+            "status": self.status,
+            "message": self.message,
+            "error": self.error,
+            "ip": self.ip,
+            "ipv6": self.ipv6,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "progress": {"done": self.done, "total": self.total},
+            "results": self.results,
+        }
+
+
+class SyncJobQueue:
+    """Single-flight runner per key: at most one sync of a key runs at a time,
+    and triggers that arrive while it is running join it instead of starting
+    another.
+
+    A trigger with ``rerun=True`` (e.g. an address change) may have news the
+    running sync has already missed, so it queues one more run after it.
+
+    With ``keys`` (e.g. the Cloudflare accounts), a trigger without a key
+    fans out to every key and returns a group job that collects their
+    results, so a key whose sync is stuck only holds up its own runs.
+    """
+
+    def __init__(
+        self,
+        runner: Callable[[SyncJob], Awaitable[None]],
+        keep: int = 20,
+        on_update: Optional[Callable[[SyncJob], None]] = None,
+        keys: Optional[Callable[[], Iterable[str]]] = None,
+    ):
+        self._runner = runner
+        self._keep = keep
+        self._on_update = on_update
+        self._keys = keys
+        self._jobs: "OrderedDict[str, SyncJob]" = OrderedDict()
+        self._current: Dict[Optional[str], SyncJob] = {}
+        self._tasks: Dict[Optional[str], asyncio.Task] = {}
+        self._rerun: Dict[Optional[str], str] = {}
+        self._groups: set = set()
+
+    @property
+    def latest(self) -> Optional[SyncJob]:
+        return next(reversed(self._jobs.values()), None) if self._jobs else None
+
+    def get(self, job_id: str) -> Optional[SyncJob]:
+        return self._jobs.get(job_id)
+
+    @property
+    def running(self) -> bool:
+        return bool(self._current)
+
+    def trigger(self, reason: str = "manual", rerun: bool = False, key: Optional[str] = None) -> SyncJob:
+        return self._trigger(reason, rerun, key)[0]
+
+    def _trigger(self, reason: str, rerun: bool, key: Optional[str]):
+        if key is None and self._keys is not None:
+            return self._trigger_group(reason, rerun)
+        current = self._current.get(key)
+        if current is not None:
+            if rerun:
+                self._rerun[key] = reason
+            return current, self._tasks[key]
+        job = SyncJob(reason, key)
+        self._add(job)
+        self._current[key] = job
+        task = self._tasks[key] = asyncio.create_task(self._execute(job))
+        self._notify(job)
+        return job, task
+
+    def _trigger_group(self, reason: str, rerun: bool):
+        members = [self._trigger(reason, rerun, key) for key in self._keys()]
+        if len(members) == 1:
+            return members[0]
+        group = SyncJob(reason)
+        self._add(group)
+        task = asyncio.create_task(self._collect(group, members))
+        self._groups.add(task)
+        task.add_done_callback(self._groups.discard)
+        self._notify(group)
+        return group, task
+
+    def _add(self, job: SyncJob):
+        self._jobs[job.id] = job
+        while len(self._jobs) > self._keep:
+            self._jobs.popitem(last=False)
+
+    async def run(self, reason: str = "schedule", key: Optional[str] = None) -> SyncJob:
+        """Trigger (or join) a run and wait for it to finish."""
+        job, task = self._trigger(reason, False, key)
+        await asyncio.shield(task)
+        return job
+
+    async def _collect(self, group: SyncJob, members: List):
+        """Fill ``group`` in from its members' jobs as they finish."""
+        pending = {task: job for job, task in members}
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    job = pending.pop(task)
+                    group.results.update(job.results)
+                    group.total += job.total
+                    group.done += job.done
+                    group.ip = group.ip or job.ip
+                    group.ipv6 = group.ipv6 or job.ipv6
+                    group.message = group.message or job.message
+                if pending:
+                    self._notify(group)
+            jobs = [job for job, _ in members]
+            errors = [(job.key, job.error) for job in jobs if job.error]
+            if len(jobs) > 1:
+                group.error = "; ".join("%s: %s" % e for e in errors) or None
+            elif errors:
+                group.error = errors[0][1]
+            statuses = {job.status for job in jobs}
+            group.status = next((s for s in ("cancelled", "failed") if s in statuses), "done")
+        except asyncio.CancelledError:
+            group.status = "cancelled"
+            raise
+        finally:
+            group.finished_at = time.time()
+            self._notify(group)
+
+    async def _execute(self, job: SyncJob):
+        try:
+            await self._runner(job)
+            failed = job.error or any(r["status"] == "failed" for r in job.results.values())
+            job.status = "failed" if failed else "done"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            raise
+        except Exception as e:
+            logger.exception("Sync job %s failed: %s", job.id, e)
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            self._current.pop(job.key, None)
+            self._tasks.pop(job.key, None)
+            self._notify(job)
+            rerun = self._rerun.pop(job.key, None)
+            if rerun and job.status != "cancelled":
+                self.trigger(rerun, key=job.key)
+
+    def _notify(self, job: SyncJob):
+        if self._on_update is None:
+            return
+        try:
+            self._on_update(job)
+        except Exception:
+            logger.exception("Job update callback failed")
+
+    async def cancel(self):
+        self._rerun.clear()
+        tasks = list(self._tasks.values()) + list(self._groups)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,174 @@
+import asyncio
+import errno
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, a single process is assumed
+    fcntl = None
+
+from .config import ConfigManager
+from .jobs import SyncJob
+from .storage import _atomic_write_json, _read_json
+from .sync import SyncEngine
+
+logger = logging.getLogger(__name__)
+
+# How often followers try to take over and every process checks shared state.
+LEADER_POLL_INTERVAL = float(os.environ.get("LEADER_POLL_INTERVAL", "2"))
+
+
+class SyncCoordinator:
+    """Runs the SyncEngine in exactly one of the processes sharing a data dir.
+
+    Leadership is an exclusive ``flock`` on ``sync.lock``. The kernel drops the
+    lock when the leader exits or dies, and the next follower to poll takes
+    over. Followers forward "sync now" by touching ``sync.trigger``; the
+    leader publishes its status to ``sync_state.json`` for followers to serve.
+    """
+
+    def __init__(self, cfg: ConfigManager, engine: SyncEngine, data_dir: str, poll_interval: float = LEADER_POLL_INTERVAL):
+        self.cfg = cfg
+        self.engine = engine
+        self.poll_interval = poll_interval
+        self.lock_path = os.path.join(data_dir, "sync.lock")
+        self.trigger_path = os.path.join(data_dir, "sync.trigger")
+        self.state_path = os.path.join(data_dir, "sync_state.json")
+        self.is_leader = False
+        self._fd: Optional[int] = None
+        self._trigger_seen: Optional[int] = None
+        self._published: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _try_acquire(self) -> bool:
+        if fcntl is None:
+            return True
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError as e:
+            os.close(fd)
+            if e.errno in (errno.EWOULDBLOCK, errno.EAGAIN):
+                return False
+            # e.g. ENOLCK on NFS/SMB shares: nobody could ever lead, so behave
+            # like a single process rather than never syncing
+            logger.error(
+                "Cannot lock %s (%s); syncing without leader election. Run a single worker on this filesystem.",
+                self.lock_path, e,
+            )
+            return True
+        self._fd = fd
+        return True
+
+    def _release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self.is_leader = False
+        self._published = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self.is_leader:
+            await self.engine.stop()
+            self._release()
+
+    async def _run(self):
+        while True:
+            try:
+                await self._tick()
+            except Exception as e:
+                logger.exception("Leader coordination error: %s", e)
+            await asyncio.sleep(self.poll_interval)
+
+    async def _tick(self):
+        # pick up records/settings written by the other workers
+        self.cfg.refresh()
+        self.engine.status.refresh()
+        if not self.is_leader and self._try_acquire():
+            self.is_leader = True
+            self._trigger_seen = self._trigger_mtime()
+            logger.info("Process %d is now the sync leader", os.getpid())
+            await self.engine.start()
+        self.engine.status.publish(sync_leader=self.is_leader)
+        if not self.is_leader:
+            self._mirror()
+            return
+        self.engine.interval = self.cfg.load_polling_interval()
+        mtime = self._trigger_mtime()
+        if mtime != self._trigger_seen:
+            self._trigger_seen = mtime
+            logger.info("Sync requested by another worker")
+            self.engine.jobs.trigger("forwarded")
+        self._publish()
+
+    def _trigger_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.trigger_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _publish(self):
+        latest = self.engine.jobs.latest
+        state = {
+            "leader_pid": os.getpid(),
+            "wan_ip": self.engine.last_ip,
+            "wan_ipv6": self.engine.last_addresses.get(6),
+            "last_success": self.engine.last_success,
+            "last_job": latest.to_dict() if latest else None,
+        }
+        # an idle leader must not fsync /data every tick (it keeps disks spinning)
+        if state == self._published:
+            return
+        _atomic_write_json(self.state_path, dict(state, updated_at=time.time()))
+        self._published = state
+
+    def _mirror(self):
+        # followers serve the leader's view; publish() ignores unchanged fields
+        state = self.leader_state()
+        if state:
+            self.engine.status.publish(
+                wan_ip=state.get("wan_ip"),
+                wan_ipv6=state.get("wan_ipv6"),
+                last_success=state.get("last_success"),
+                last_job=state.get("last_job"),
+                syncing=(state.get("last_job") or {}).get("status") == "running",
+            )
+
+    def leader_state(self) -> Dict[str, Any]:
+        """Status published by the current leader (empty if none yet)."""
+        try:
+            return _read_json(self.state_path)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def request_sync(self) -> Optional[SyncJob]:
+        """Start (or join) a sync here if we lead, otherwise ask the leader to.
+
+        Returns the job when it runs in this process, None when forwarded.
+        """
+        if not self.is_leader:
+            with open(self.trigger_path, "a"):
+                os.utime(self.trigger_path, None)
+            return None
+        return self.engine.jobs.trigger("manual")
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.engine.jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        last = self.leader_state().get("last_job") or {}
+        return last if last.get("id") == job_id else None
@@ -0,0 +1,135 @@
+"""Logging that never blocks the event loop.
+
+``configure_logging`` puts a ``QueueHandler`` on the root logger; a
+``QueueListener`` thread does the formatting and the console/file I/O. The
+file handler rotates by size so ``/data`` can't fill up, and is safe to share
+between uvicorn workers and the worker sidecar. Levels are set with
+``LOG_LEVEL`` and per module with ``LOG_LEVELS``, e.g.
+``app.cloudflare_client=DEBUG,httpx=WARNING``.
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, a single process is assumed
+    fcntl = None
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.environ.get("LOG_LEVELS", "")
+LOG_DIR = os.environ.get("LOG_DIR", os.path.join(os.environ.get("DATA_DIR", "/data"), "logs"))
+LOG_MAX_BYTES = int(os.environ.get("LOG_MAX_BYTES", str(5 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.environ.get("LOG_BACKUP_COUNT", "3"))
+
+LOG_FORMAT = "%(asctime)s %(name)s %(levelname)s %(message)s"
+
+# chatty third-party loggers, unless LOG_LEVELS says otherwise
+DEFAULT_LEVELS = {"httpx": "WARNING", "httpcore": "WARNING", "hpack": "WARNING"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class SharedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """``RotatingFileHandler`` for a file several processes write to.
+
+    Each record is written under an exclusive ``flock`` on ``<file>.lock``, so
+    only one process rolls the file over at a time, and a process whose file
+    was rotated by another reopens it instead of writing to the old inode.
+    """
+
+    def __init__(self, filename: str, **kwargs):
+        super().__init__(filename, **kwargs)
+        self._lock_fd = None
+        if fcntl is not None:
+            self._lock_fd = os.open(self.baseFilename + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+
+    def emit(self, record: logging.LogRecord):
+        if self._lock_fd is None:
+            return super().emit(record)
+        try:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        except OSError:
+            return super().emit(record)
+        try:
+            self._reopen_if_rotated()
+            super().emit(record)
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _reopen_if_rotated(self):
+        if self.stream is None:
+            return
+        try:
+            current = os.stat(self.baseFilename)
+        except FileNotFoundError:
+            current = None
+        opened = os.fstat(self.stream.fileno())
+        if current is None or (current.st_dev, current.st_ino) != (opened.st_dev, opened.st_ino):
+            self.stream.close()
+            self.stream = self._open()
+
+    def close(self):
+        super().close()
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+
+def parse_levels(spec: str) -> Dict[str, str]:
+    levels = {}
+    for item in spec.split(","):
+        name, sep, level = item.partition("=")
+        if sep and name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(
+    level: str = LOG_LEVEL,
+    levels: str = LOG_LEVELS,
+    log_dir: Optional[str] = LOG_DIR,
+    max_bytes: int = LOG_MAX_BYTES,
+    backup_count: int = LOG_BACKUP_COUNT,
+) -> Optional[logging.handlers.QueueListener]:
+    """Install the queue pipeline once; later calls only re-apply levels."""
+    global _listener
+    root = logging.getLogger()
+    root.setLevel(level)
+    for name, lvl in {**DEFAULT_LEVELS, **parse_levels(levels)}.items():
+        logging.getLogger(name).setLevel(lvl)
+    if _listener is not None:
+        return _listener
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if log_dir:
+        try:
+            os.makedirs(log_dir, exist_ok=True)
+            handlers.append(SharedRotatingFileHandler(
+                os.path.join(log_dir, "sync.log"), maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8",
+            ))
+        except OSError as e:
+            logging.getLogger(__name__).warning("File logging disabled: %s", e)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Drain the queue and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
@@ -2,22 +2,40 @@ import os
 import asyncio
 import logging
 from fastapi import FastAPI, HTTPException, Request, Form
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
-import httpx
 
-from .config import ConfigManager
+from . import metrics
+from .config import DEFAULT_ACCOUNT, ConfigManager, account_of
 from .sync import SyncEngine
-from .cloudflare_client import CloudflareClient
+from .cloudflare_client import CloudflareAccounts, CloudflareClient
+from .history import SyncHistory
+from .ip_detect import WanIpDetector
+from .leader import SyncCoordinator
+from .logging_setup import configure_logging
+from .netwatch import make_address_source
+from .snapshots import ZoneSnapshotCache
+from .status import StatusHub
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+configure_logging()
 
 class ImportRecordsRequest(BaseModel):
     zone_id: str
     record_ids: list = None
+    account: str = DEFAULT_ACCOUNT
+
+class AccountRequest(BaseModel):
+    name: str
+    token: str
+
+class BulkProxyRequest(BaseModel):
+    record_ids: list
+    proxied: bool
+
+ADDRESS_TYPES = ("A", "AAAA")
 
 DATA_DIR = os.environ.get("DATA_DIR", "/data")
 CONFIG_SECRET = os.environ.get("CONFIG_SECRET")
@@ -27,47 +45,87 @@ app.mount("/static", StaticFiles(directory="app/static"), name="static")
 templates = Jinja2Templates(directory="app/templates")
 
 cfg = ConfigManager(secret=CONFIG_SECRET)
-sync_engine = SyncEngine(cfg, interval=cfg.load_polling_interval())
+# one client pool and rate limiter per Cloudflare account, shared with the sync engine
+cf_accounts = CloudflareAccounts(cfg.load_token)
+ip_detector = WanIpDetector()
+zone_snapshots = ZoneSnapshotCache()
+sync_history = SyncHistory(DATA_DIR)
+# what /api/status and the SSE stream serve; config-derived fields are
+# recomputed by status_hub.refresh() whenever the config changes
+status_hub = StatusHub(lambda: {
+    "token_configured": bool(cfg.list_accounts()),
+    "accounts": cfg.list_accounts(),
+    "record_count": cfg.record_count(),
+    "polling_interval": cfg.load_polling_interval(),
+})
+sync_engine = SyncEngine(
+    cfg,
+    interval=cfg.load_polling_interval(),
+    accounts=cf_accounts,
+    detector=ip_detector,
+    snapshots=zone_snapshots,
+    address_source=make_address_source(),
+    status=status_hub,
+    history=sync_history,
+)
+# with `uvicorn --workers N` only the elected leader runs the sync loop
+coordinator = SyncCoordinator(cfg, sync_engine, DATA_DIR)
 
 @app.on_event("startup")
 async def startup_event():
-    await sync_engine.start()
+    # warm the shared clients so the first dashboard click skips pool setup
+    for account in cfg.list_accounts():
+        await cf_accounts.get(account)
+    await coordinator.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    await sync_engine.stop()
+    await coordinator.stop()
+    await cf_accounts.close()
+    await ip_detector.close()
+    sync_history.close()
+    cfg.flush()
+
+async def get_cf(account: str = DEFAULT_ACCOUNT) -> CloudflareClient:
+    # checked before cf_accounts creates (and keeps) a manager for the name
+    if account not in cfg.list_accounts():
+        raise HTTPException(status_code=404, detail=f"Unknown account {account}")
+    cf = await cf_accounts.get(account)
+    if cf is None:
+        raise HTTPException(status_code=400, detail=f"No token configured for account {account}")
+    return cf
 
 @app.get("/", response_class=HTMLResponse)
 async def dashboard(request: Request):
-    token_present = cfg.load_token() is not None
-    records = cfg.load_records().get("records", [])
-    return templates.TemplateResponse("dashboard.html", {"request": request, "token_present": token_present, "records": records})
+    token_present = bool(cfg.list_accounts())
+    # rows are fetched page by page from /api/records
+    return templates.TemplateResponse("dashboard.html", {
+        "request": request,
+        "token_present": token_present,
+        "record_count": cfg.record_count(),
+        "zones": cfg.zone_ids(),
+    })
 
 @app.get("/health")
 async def health():
     return {"status": "ok"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/api/status")
 async def api_status():
-    token = cfg.load_token()
-    records = cfg.load_records().get("records", [])
-    polling_interval = cfg.load_polling_interval()
-    
-    # Get current WAN IP
-    wan_ip = "Unknown"
-    try:
-        from .ip_detect import detect_wan_ip
-        async with httpx.AsyncClient() as client:
-            wan_ip = await detect_wan_ip(client)
-    except Exception as e:
-        logger.error(f"Failed to detect WAN IP: {e}")
-    
-    return {
-        "token_configured": bool(token),
-        "record_count": len(records),
-        "polling_interval": polling_interval,
-        "wan_ip": wan_ip
-    }
+    return status_hub.snapshot()
+
+@app.get("/api/status/stream")
+async def api_status_stream():
+    """Server-Sent Events: the status snapshot now and after every change."""
+    return StreamingResponse(
+        status_hub.stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.post("/api/polling-interval")
 async def api_set_polling_interval(interval: int = None):
@@ -76,188 +134,340 @@ async def api_set_polling_interval(interval: int = None):
     cfg.save_polling_interval(interval)
     # Update the running sync engine interval
     sync_engine.interval = interval
-    logger.info(f"Polling interval updated to {interval} seconds")
+    status_hub.refresh()
+    logger.info("Polling interval updated to %s seconds", interval)
     return {"ok": True, "polling_interval": interval}
 
 @app.get("/api/config")
 async def get_config():
-    token = cfg.load_token()
-    return {"token_configured": bool(token)}
+    accounts = cfg.list_accounts()
+    return {"token_configured": bool(accounts), "accounts": accounts}
 
 @app.post("/api/config")
-async def post_config(token: str = Form(...)):
+async def post_config(token: str = Form(...), account: str = Form(DEFAULT_ACCOUNT)):
     # accept token via form
-    cfg.save_token(token)
+    await _save_account(account.strip() or DEFAULT_ACCOUNT, token)
     return RedirectResponse(url='/', status_code=303)
 
+async def _save_account(account: str, token: str):
+    cfg.save_token(token, account)
+    await cf_accounts.rebuild(account)
+    zone_snapshots.invalidate()
+    status_hub.refresh()
+
+@app.get("/api/accounts")
+async def api_accounts():
+    counts = {}
+    for rec in cfg.load_records().get("records", []):
+        counts[account_of(rec)] = counts.get(account_of(rec), 0) + 1
+    return [{"name": name, "record_count": counts.get(name, 0)} for name in cfg.list_accounts()]
+
+@app.post("/api/accounts")
+async def api_add_account(req: AccountRequest):
+    name = req.name.strip()
+    if not name or not req.token.strip():
+        raise HTTPException(status_code=400, detail="Account name and token are required")
+    await _save_account(name, req.token.strip())
+    logger.info("Saved token for account %s", name)
+    return {"ok": True, "name": name}
+
+@app.delete("/api/accounts/{name}")
+async def api_delete_account(name: str):
+    if cfg.records_for_account(name):
+        raise HTTPException(status_code=409, detail="Account still has records; delete them first")
+    if not cfg.delete_account(name):
+        raise HTTPException(status_code=404, detail="Account not found")
+    await cf_accounts.discard(name)
+    status_hub.refresh()
+    return {"ok": True}
+
 @app.get("/api/zones")
-async def api_zones():
-    token = cfg.load_token()
-    if not token:
+async def api_zones(account: str = None):
+    """Zones of one account, or of every account (tagged with ``account``)."""
+    names = [account] if account else cfg.list_accounts()
+    if not names:
         raise HTTPException(status_code=400, detail="No token configured")
+    clients = [await get_cf(name) for name in names]
     try:
-        cf = CloudflareClient(token)
-        zones = await cf.list_zones()
-        await cf.close()
-        logger.info(f"Fetched {len(zones)} zones from Cloudflare")
+        listings = await asyncio.gather(*(cf.list_zones() for cf in clients))
+        zones = [dict(zone, account=name) for name, listing in zip(names, listings) for zone in listing]
+        logger.info("Fetched %s zones from %s Cloudflare account(s)", len(zones), len(names))
         return zones
     except Exception as e:
-        logger.exception(f"Error fetching zones: {e}")
+        logger.exception("Error fetching zones: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to fetch zones: {str(e)}")
 
 @app.get("/api/zones/{zone_id}/records")
-async def api_zone_records(zone_id: str):
-    token = cfg.load_token()
-    if not token:
-        raise HTTPException(status_code=400, detail="No token configured")
+async def api_zone_records(zone_id: str, account: str = DEFAULT_ACCOUNT):
+    cf = await get_cf(account)
     try:
-        cf = CloudflareClient(token)
-        # Fetch A and AAAA records
-        a_records = await cf.list_records(zone_id, record_type="A")
-        aaaa_records = await cf.list_records(zone_id, record_type="AAAA")
-        await cf.close()
-        all_records = a_records + aaaa_records
-        logger.info(f"Fetched {len(all_records)} A/AAAA records for zone {zone_id}")
+        # Served from the zone snapshot while fresh, otherwise re-listed
+        snap = await zone_snapshots.get(cf, zone_id)
+        all_records = list(snap.records.values())
+        logger.info("Fetched %s A/AAAA records for zone %s", len(all_records), zone_id)
         return {"records": all_records}
     except Exception as e:
-        logger.exception(f"Error fetching records for zone {zone_id}: {e}")
+        logger.exception("Error fetching records for zone %s: %s", zone_id, e)
         raise HTTPException(status_code=500, detail=f"Failed to fetch records: {str(e)}")
 
 @app.post("/api/import-records")
 async def api_import_records(req: ImportRecordsRequest):
     """Import selected records from Cloudflare into local storage."""
-    token = cfg.load_token()
-    if not token:
-        raise HTTPException(status_code=400, detail="No token configured")
+    cf = await get_cf(req.account)
     try:
-        cf = CloudflareClient(token)
-        a_records = await cf.list_records(req.zone_id, record_type="A")
-        aaaa_records = await cf.list_records(req.zone_id, record_type="AAAA")
-        await cf.close()
-        all_records = a_records + aaaa_records
-        
-        # If record_ids provided, filter; otherwise import all
-        if req.record_ids:
-            all_records = [r for r in all_records if r.get("id") in req.record_ids]
-        
+        wanted = set(req.record_ids or [])
         # Convert to internal format and save
-        data = cfg.load_records()
-        stored_records = data.get("records", [])
-        
-        imported_count = 0
-        for cf_record in all_records:
+        new_records = []
+        async for cf_record in cf.iter_records(req.zone_id, types=ADDRESS_TYPES, prefetch=True):
+            # If record_ids provided, filter; otherwise import all
+            if wanted and cf_record.get("id") not in wanted:
+                continue
             # Check if already imported
-            if any(sr.get("record_id") == cf_record.get("id") for sr in stored_records):
+            if cfg.has_record(cf_record.get("id")):
                 continue
-            stored_records.append({
+            new_records.append({
                 "zone_id": req.zone_id,
                 "record_id": cf_record.get("id"),
                 "name": cf_record.get("name"),
                 "type": cf_record.get("type"),
                 "content": cf_record.get("content"),
-                "auto_update": False
+                "auto_update": False,
+                "account": req.account,
             })
-            imported_count += 1
         
-        cfg.save_records({"records": stored_records})
-        logger.info(f"Imported {imported_count} records with auto_update enabled")
+        cfg.add_records(new_records)
+        status_hub.refresh()
+        imported_count = len(new_records)
+        logger.info("Imported %s records with auto_update enabled", imported_count)
         return {"ok": True, "imported": imported_count}
     except Exception as e:
-        logger.exception(f"Error importing records: {e}")
+        logger.exception("Error importing records: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to import records: {str(e)}")
 
+def _not_modified(request: Request, etag: str) -> bool:
+    tags = [t.strip() for t in request.headers.get("if-none-match", "").split(",")]
+    return etag in tags or "*" in tags
+
 @app.get("/api/records")
-async def api_records():
-    return cfg.load_records()
+async def api_records(
+    request: Request,
+    zone_id: str = None,
+    name: str = None,
+    type: str = None,
+    auto_update: bool = None,
+    account: str = None,
+    sort: str = "name",
+    order: str = "asc",
+    cursor: str = None,
+    limit: int = 100,
+):
+    """One page of tracked records; follow ``next_cursor`` for the rest.
+
+    The ETag changes whenever any record does, so an unchanged page costs a
+    304 and no body.
+    """
+    etag = 'W/"%s-%d"' % (cfg.instance_id, cfg.revision)
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    try:
+        page = cfg.query_records(
+            zone_id=zone_id, name=name, type=type, auto_update=auto_update, account=account,
+            sort=sort, descending=order == "desc", cursor=cursor, limit=max(1, min(limit, 1000)),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse(page, headers={"ETag": etag, "Cache-Control": "no-cache"})
 
 @app.post("/api/records")
 async def api_add_record(payload: dict):
-    data = cfg.load_records()
-    recs = data.get("records", [])
-    recs.append(payload)
-    cfg.save_records({"records": recs})
+    cfg.add_record(payload)
+    status_hub.refresh()
     return {"ok": True}
 
 @app.patch("/api/records")
 async def api_patch_record(record_id: str = None, auto_update: str = None):
-    data = cfg.load_records()
-    recs = data.get("records", [])
-    for r in recs:
-        if r.get("record_id") == record_id:
-            if auto_update is not None:
-                # Handle checkbox string values from HTMX
-                r["auto_update"] = auto_update.lower() in ('true', '1', 'on', 'yes')
-            cfg.save_records({"records": recs})
-            return {"ok": True}
+    fields = {}
+    if auto_update is not None:
+        # Handle checkbox string values from HTMX
+        fields["auto_update"] = auto_update.lower() in ('true', '1', 'on', 'yes')
+    if cfg.update_record(record_id, **fields):
+        return {"ok": True}
     raise HTTPException(status_code=404, detail="Record not found")
 
 @app.delete("/api/records")
 async def api_delete_record(id: str):
-    data = cfg.load_records()
-    recs = data.get("records", [])
-    recs = [r for r in recs if r.get("record_id") != id]
-    cfg.save_records({"records": recs})
+    cfg.delete_record(id)
+    status_hub.refresh()
     return {"ok": True}
 
+def _records_by_zone(record_ids=None) -> dict:
+    by_zone = {}
+    for rec in cfg.load_records().get("records", []):
+        if record_ids is not None and rec.get("record_id") not in record_ids:
+            continue
+        by_zone.setdefault(rec.get("zone_id"), []).append(rec)
+    return by_zone
+
+@app.get("/api/records/proxy")
+async def api_get_records_proxy(record_ids: str = None):
+    """Get proxy status for tracked records (all, or a comma-separated
+    ``record_ids`` list), grouped by zone.
+
+    Each zone costs at most one paginated listing and nothing while its
+    snapshot is fresh.
+    """
+    wanted = set(record_ids.split(",")) if record_ids else None
+    try:
+        zones = {}
+        for zone_id, recs in _records_by_zone(wanted).items():
+            cf = await get_cf(account_of(recs[0]))
+            snap = await zone_snapshots.get(cf, zone_id)
+            zones[zone_id] = {
+                r.get("record_id"): snap.records.get(r.get("record_id"), {}).get("proxied")
+                for r in recs
+            }
+        return {"zones": zones}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error getting proxy statuses: %s", e)
+        raise HTTPException(status_code=500, detail=f"Failed to get proxy statuses: {str(e)}")
+
+@app.patch("/api/records/proxy")
+async def api_set_records_proxy(req: BulkProxyRequest):
+    """Set proxy status for several records with one batch call per zone."""
+    try:
+        wanted = set(req.record_ids)
+        updated = []
+        errors = {}
+        for zone_id, recs in _records_by_zone(wanted).items():
+            cf = await get_cf(account_of(recs[0]))
+            patches = [{"id": r.get("record_id"), "proxied": req.proxied} for r in recs]
+            result, zone_errors = await cf.batch_update_records(zone_id, patches)
+            zone_snapshots.apply(zone_id, result.values())
+            updated.extend(result)
+            errors.update(zone_errors)
+        failed = sorted(wanted - set(updated))
+        for record_id in failed:
+            errors.setdefault(record_id, "not a tracked record")
+        logger.info("Set proxied=%s on %s records (%s failed)", req.proxied, len(updated), len(failed))
+        return {
+            "ok": not failed, "proxied": req.proxied, "updated": updated, "failed": failed,
+            "errors": {record_id: errors[record_id] for record_id in failed},
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error setting proxy statuses: %s", e)
+        raise HTTPException(status_code=500, detail=f"Failed to set proxy statuses: {str(e)}")
+
 @app.get("/api/records/{record_id}/proxy")
 async def api_get_record_proxy(record_id: str):
     """Get proxy status for a record."""
-    token = cfg.load_token()
-    if not token:
-        raise HTTPException(status_code=400, detail="No token configured")
     try:
-        data = cfg.load_records()
-        records = data.get("records", [])
-        rec = next((r for r in records if r.get("record_id") == record_id), None)
+        rec = cfg.get_record(record_id)
         if not rec:
             raise HTTPException(status_code=404, detail="Record not found")
-        
+        cf = await get_cf(account_of(rec))
+
         zone_id = rec.get("zone_id")
-        cf = CloudflareClient(token)
-        record = await cf.get_record(zone_id, record_id)
-        await cf.close()
+        record = zone_snapshots.lookup(zone_id, record_id) or await cf.get_record(zone_id, record_id)
         
         proxied = record.get("proxied", False)
-        logger.info(f"Retrieved proxy status for {rec.get('name')}: {proxied}")
+        logger.info("Retrieved proxy status for %s: %s", rec.get('name'), proxied)
         return {"proxied": proxied}
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.exception(f"Error getting proxy status: {e}")
+        logger.exception("Error getting proxy status: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to get proxy status: {str(e)}")
 
 @app.patch("/api/records/{record_id}/proxy")
 async def api_set_record_proxy(record_id: str, proxied: str = None):
     """Set proxy status for a record."""
-    token = cfg.load_token()
-    if not token:
-        raise HTTPException(status_code=400, detail="No token configured")
     try:
         # Convert string to boolean
         if proxied is None:
             raise HTTPException(status_code=400, detail="proxied parameter required")
         proxied_bool = proxied.lower() in ('true', '1', 'on', 'yes')
         
-        data = cfg.load_records()
-        records = data.get("records", [])
-        rec = next((r for r in records if r.get("record_id") == record_id), None)
+        rec = cfg.get_record(record_id)
         if not rec:
             raise HTTPException(status_code=404, detail="Record not found")
-        
+        cf = await get_cf(account_of(rec))
+
         zone_id = rec.get("zone_id")
-        cf = CloudflareClient(token)
         updated = await cf.update_record_proxy(zone_id, record_id, proxied_bool)
-        await cf.close()
+        zone_snapshots.apply(zone_id, [updated])
         
-        logger.info(f"Updated proxy status for {rec.get('name')}: {proxied_bool}")
+        logger.info("Updated proxy status for %s: %s", rec.get('name'), proxied_bool)
         return {"ok": True, "proxied": proxied_bool}
     except HTTPException:
         raise
     except Exception as e:
-        logger.exception(f"Error setting proxy status: {e}")
+        logger.exception("Error setting proxy status: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to set proxy status: {str(e)}")
 
+def _history_page(page: dict, key: str) -> dict:
+    return {key: page["items"], "next_cursor": page["next_cursor"]}
+
+@app.get("/api/history")
+async def api_history(
+    record_id: str = None,
+    status: str = None,
+    since: float = None,
+    until: float = None,
+    cursor: str = None,
+    limit: int = 100,
+):
+    """Record updates and failures across all records, newest first.
+
+    ``since``/``until`` are Unix timestamps; follow ``next_cursor`` for older rows.
+    """
+    try:
+        page = sync_history.changes(
+            record_id=record_id, status=status, since=since, until=until, cursor=cursor, limit=max(1, min(limit, 1000)),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _history_page(page, "changes")
+
+@app.get("/api/history/cycles")
+async def api_history_cycles(since: float = None, until: float = None, cursor: str = None, limit: int = 100):
+    """Sync cycles with their duration and outcome counts, newest first."""
+    try:
+        page = sync_history.cycles(since=since, until=until, cursor=cursor, limit=max(1, min(limit, 1000)))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _history_page(page, "cycles")
+
+@app.get("/api/records/{record_id}/history")
+async def api_record_history(record_id: str, since: float = None, until: float = None, cursor: str = None, limit: int = 100):
+    return await api_history(record_id=record_id, since=since, until=until, cursor=cursor, limit=limit)
+
 @app.post("/api/update-now")
 async def api_update_now():
-    # run one sync loop
-    loop = asyncio.get_event_loop()
-    await sync_engine._run_once()
-    return {"ok": True}
+    """Start a sync in the background (or join the one already running)."""
+    job = coordinator.request_sync()
+    if job is None:
+        # handed to the leader worker: if it is mid-sync the trigger joins that
+        # job, so point the caller at it; otherwise a new job shows up in /api/jobs/latest
+        last = coordinator.leader_state().get("last_job") or {}
+        joined = last.get("id") if last.get("status") == "running" else None
+        return {"ok": True, "job_id": joined, "forwarded": True}
+    return {"ok": True, "job_id": job.id, "forwarded": False}
+
+@app.get("/api/jobs/latest")
+async def api_latest_job():
+    latest = sync_engine.jobs.latest
+    job = latest.to_dict() if latest else coordinator.leader_state().get("last_job")
+    if not job:
+        raise HTTPException(status_code=404, detail="No sync job yet")
+    return job
+
+@app.get("/api/jobs/{job_id}")
+async def api_job(job_id: str):
+    job = coordinator.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
@@ -0,0 +1,194 @@
+"""Minimal Prometheus-style metrics and tracing hooks.
+
+Only what the app needs: counters, gauges and histograms with labels, rendered
+in the Prometheus text format by ``render``. ``timed`` observes a histogram
+and also reports the span to any tracer registered with ``add_tracer``, which
+is how a single sync cycle can be profiled.
+"""
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+Tracer = Callable[[str, Dict[str, str], float], None]
+
+_metrics: List["_Metric"] = []
+_tracers: List[Tracer] = []
+
+
+def _key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _fmt_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    body = ",".join('%s="%s"' % (k, v.replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+    return "{" + body + "}"
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, doc: str):
+        self.name = name
+        self.doc = doc
+        _metrics.append(self)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, doc: str):
+        super().__init__(name, doc)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_key(labels), 0.0)
+
+    def samples(self):
+        return ["%s%s %s" % (self.name, _fmt_labels(k), v) for k, v in self._values.items()]
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, doc: str, fn: Optional[Callable[[], Optional[float]]] = None):
+        super().__init__(name, doc)
+        self._values: Dict[LabelKey, float] = {}
+        self._fn = fn
+
+    def set(self, value: float, **labels):
+        self._values[_key(labels)] = value
+
+    def samples(self):
+        if self._fn is not None:
+            value = self._fn()
+            return [] if value is None else ["%s %s" % (self.name, value)]
+        return ["%s%s %s" % (self.name, _fmt_labels(k), v) for k, v in self._values.items()]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, doc: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, doc)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: Dict[LabelKey, List[int]] = {}
+        self._sums: Dict[LabelKey, float] = {}
+
+    def observe(self, value: float, **labels):
+        key = _key(labels)
+        counts = self._counts.get(key)
+        if counts is None:
+            counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+            self._sums[key] = 0.0
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+        self._sums[key] += value
+
+    def count(self, **labels) -> int:
+        return sum(self._counts.get(_key(labels), []))
+
+    def samples(self):
+        out = []
+        for key, counts in self._counts.items():
+            running = 0
+            for bound, n in zip(self.buckets, counts):
+                running += n
+                out.append("%s_bucket%s %d" % (self.name, _fmt_labels(key, (("le", repr(bound)),)), running))
+            running += counts[-1]
+            out.append("%s_bucket%s %d" % (self.name, _fmt_labels(key, (("le", "+Inf"),)), running))
+            out.append("%s_sum%s %s" % (self.name, _fmt_labels(key), self._sums[key]))
+            out.append("%s_count%s %d" % (self.name, _fmt_labels(key), running))
+        return out
+
+
+def render() -> str:
+    lines = []
+    for metric in _metrics:
+        lines.append("# HELP %s %s" % (metric.name, metric.doc))
+        lines.append("# TYPE %s %s" % (metric.name, metric.type))
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+def add_tracer(tracer: Tracer):
+    """Call ``tracer(name, labels, seconds)`` for every ``timed`` span."""
+    _tracers.append(tracer)
+
+
+def remove_tracer(tracer: Tracer):
+    if tracer in _tracers:
+        _tracers.remove(tracer)
+
+
+@contextmanager
+def timed(histogram: Histogram, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        histogram.observe(elapsed, **labels)
+        for tracer in list(_tracers):
+            try:
+                tracer(histogram.name, labels, elapsed)
+            except Exception:
+                logger.exception("Tracer failed")
+
+
+def _log_tracer(name: str, labels: Dict[str, str], seconds: float):
+    logger.info("trace %s %s %.1fms", name, labels, seconds * 1000)
+
+
+if os.environ.get("SYNC_TRACE", "false").lower() in ("true", "1", "on", "yes"):
+    add_tracer(_log_tracer)
+
+
+# -- app metrics ---------------------------------------------------------
+
+CF_REQUEST_SECONDS = Histogram("cf_api_request_duration_seconds", "Cloudflare API request latency by endpoint and status.")
+CF_RETRIES = Counter("cf_api_retries_total", "Cloudflare API retries by endpoint and reason.")
+CF_RATE_LIMITED = Counter("cf_api_rate_limited_total", "Cloudflare API 429 responses by endpoint.")
+CF_CIRCUIT_OPENED = Counter("cf_api_circuit_opened_total", "Times an endpoint's circuit breaker opened.")
+CF_FAST_FAILURES = Counter("cf_api_fast_failures_total", "Cloudflare API calls failed without retrying, by endpoint and reason (circuit_open, deadline).")
+CF_HEDGED = Counter("cf_api_hedged_requests_total", "Hedged duplicate GETs by endpoint and result (sent, won).")
+IP_PROVIDER_SECONDS = Histogram("ip_provider_duration_seconds", "WAN IP provider lookup latency by provider, address family and result.")
+SYNC_PHASE_SECONDS = Histogram("sync_phase_duration_seconds", "SyncEngine cycle phase duration (detect, diff, update, persist).")
+SYNC_RECORDS = Counter("sync_records_total", "Auto-update records handled by outcome (updated, skipped, failed).")
+SYNC_LAST_CYCLE_RECORDS = Gauge("sync_last_cycle_records", "Records handled in the last sync cycle by outcome.")
+SYNC_CYCLES = Counter("sync_cycles_total", "Sync cycles by result.")
+
+_last_success: Optional[float] = None
+
+
+def mark_sync_success():
+    global _last_success
+    _last_success = time.time()
+
+
+SYNC_LAST_SUCCESS = Gauge("sync_last_success_timestamp_seconds", "Unix time of the last successful sync.", lambda: _last_success)
+SYNC_SINCE_SUCCESS = Gauge(
+    "sync_seconds_since_last_success",
+    "Seconds since the last successful sync.",
+    lambda: None if _last_success is None else time.time() - _last_success,
+)
@@ -0,0 +1,176 @@
+"""Triggers a sync as soon as local interface addresses change.
+
+Sources are pluggable: ``NetlinkAddressSource`` subscribes to Linux rtnetlink
+address events, ``PollingAddressSource`` is a portable fallback that checks the
+outbound source addresses. ``AddressWatcher`` debounces bursts of events (an
+interface flap emits several) into one callback.
+"""
+import asyncio
+import logging
+import os
+import socket
+import struct
+from typing import Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# "off", "auto" (netlink where available, else poll), "netlink" or "poll".
+WATCH_INTERFACES = os.environ.get("WATCH_INTERFACES", "off").lower()
+WATCH_DEBOUNCE = float(os.environ.get("WATCH_DEBOUNCE", "3"))
+WATCH_POLL_INTERVAL = float(os.environ.get("WATCH_POLL_INTERVAL", "10"))
+
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV6_IFADDR = 0x100
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+_NLMSGHDR = struct.Struct("=LHHLL")
+
+
+class AddressChangeSource:
+    """Calls ``notify()`` whenever local addresses may have changed."""
+
+    async def start(self, notify: Callable[[], None]):
+        raise NotImplementedError
+
+    async def stop(self):
+        pass
+
+
+class NetlinkAddressSource(AddressChangeSource):
+    def __init__(self):
+        self._sock: Optional[socket.socket] = None
+        self._notify: Optional[Callable[[], None]] = None
+
+    @staticmethod
+    def available() -> bool:
+        return hasattr(socket, "AF_NETLINK")
+
+    async def start(self, notify):
+        self._notify = notify
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+        sock.bind((0, RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR))
+        sock.setblocking(False)
+        self._sock = sock
+        asyncio.get_running_loop().add_reader(sock.fileno(), self._on_readable)
+
+    def _on_readable(self):
+        try:
+            data = self._sock.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            logger.warning("Netlink read failed: %s", e)
+            return
+        if any(msg_type in (RTM_NEWADDR, RTM_DELADDR) for msg_type in _message_types(data)):
+            self._notify()
+
+    async def stop(self):
+        if self._sock is not None:
+            asyncio.get_running_loop().remove_reader(self._sock.fileno())
+            self._sock.close()
+            self._sock = None
+
+
+def _message_types(data: bytes):
+    offset = 0
+    while offset + _NLMSGHDR.size <= len(data):
+        length, msg_type, _, _, _ = _NLMSGHDR.unpack_from(data, offset)
+        if length < _NLMSGHDR.size:
+            return
+        yield msg_type
+        offset += (length + 3) & ~3
+
+
+class PollingAddressSource(AddressChangeSource):
+    """Checks which local address the kernel would use for outbound traffic.
+
+    Connecting a UDP socket sends nothing; it only selects a route, so this is
+    cheap enough to run every few seconds.
+    """
+
+    PROBES = (
+        (socket.AF_INET, ("1.1.1.1", 53)),
+        (socket.AF_INET6, ("2606:4700:4700::1111", 53)),
+    )
+
+    def __init__(self, interval: float = WATCH_POLL_INTERVAL):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def current(cls) -> Tuple[Optional[str], ...]:
+        addresses = []
+        for family, target in cls.PROBES:
+            try:
+                with socket.socket(family, socket.SOCK_DGRAM) as sock:
+                    sock.connect(target)
+                    addresses.append(sock.getsockname()[0])
+            except OSError:
+                addresses.append(None)
+        return tuple(addresses)
+
+    async def start(self, notify):
+        self._task = asyncio.create_task(self._poll(notify))
+
+    async def _poll(self, notify):
+        last = self.current()
+        while True:
+            await asyncio.sleep(self.interval)
+            now = self.current()
+            if now != last:
+                last = now
+                notify()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+def make_address_source(mode: str = WATCH_INTERFACES) -> Optional[AddressChangeSource]:
+    if mode in ("", "off", "false", "0", "no"):
+        return None
+    if mode == "poll" or (mode == "auto" and not NetlinkAddressSource.available()):
+        return PollingAddressSource()
+    if mode in ("auto", "netlink", "true", "1", "on", "yes"):
+        if not NetlinkAddressSource.available():
+            logger.warning("Netlink is not available on this platform; address watching disabled")
+            return None
+        return NetlinkAddressSource()
+    logger.warning("Unknown WATCH_INTERFACES %r; address watching disabled", mode)
+    return None
+
+
+class AddressWatcher:
+    """Debounces address-change events from a source into ``on_change`` calls."""
+
+    def __init__(self, source: AddressChangeSource, on_change: Callable[[], None], debounce: float = WATCH_DEBOUNCE):
+        self.source = source
+        self.on_change = on_change
+        self.debounce = debounce
+        self._pending: Optional[asyncio.TimerHandle] = None
+
+    async def start(self):
+        await self.source.start(self._notify)
+
+    def _notify(self):
+        if self._pending is not None:
+            self._pending.cancel()
+        self._pending = asyncio.get_running_loop().call_later(self.debounce, self._fire)
+
+    def _fire(self):
+        self._pending = None
+        logger.info("Local addresses changed; triggering sync")
+        try:
+            self.on_change()
+        except Exception as e:
+            logger.exception("Address change handler failed: %s", e)
+
+    async def stop(self):
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+        await self.source.stop()
@@ -0,0 +1,135 @@
+"""Deadlines, circuit breakers and latency tracking for upstream calls.
+
+``deadline(seconds)`` bounds everything awaited inside it: the Cloudflare
+client reads the innermost deadline from a context variable, so a sync cycle
+can cap all the requests it makes, including those in tasks it spawns.
+``CircuitBreaker`` fails fast while an endpoint keeps failing, and
+``LatencyWindow`` supplies the percentile used to decide when to hedge a read.
+"""
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Deque, Dict, List, Optional
+
+_deadline: ContextVar[Optional[float]] = ContextVar("cf_deadline", default=None)
+
+
+class DeadlineExceeded(RuntimeError):
+    pass
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+@contextmanager
+def deadline(seconds: Optional[float]):
+    """Give everything inside the block at most ``seconds`` (None: no limit).
+
+    Nested deadlines never extend an outer one.
+    """
+    if seconds is None:
+        yield
+        return
+    at = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(at if outer is None else min(outer, at))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def deadline_at(seconds: Optional[float] = None) -> Optional[float]:
+    """Monotonic time by which a call must finish: ``seconds`` from now,
+    tightened by any enclosing ``deadline``."""
+    at = time.monotonic() + seconds if seconds is not None else None
+    outer = _deadline.get()
+    if outer is None:
+        return at
+    return outer if at is None else min(at, outer)
+
+
+def remaining(at: Optional[float]) -> Optional[float]:
+    return None if at is None else at - time.monotonic()
+
+
+class CircuitBreaker:
+    """Closed -> open after ``threshold`` consecutive failures; after
+    ``cooldown`` seconds one trial call is let through (half-open), and its
+    outcome closes or re-opens the circuit."""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30.0):
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self.failures = 0
+        self.state = self.CLOSED
+        self._opened_at = 0.0
+        self._trial_at: Optional[float] = None
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        now = time.monotonic()
+        if self.state == self.OPEN and now - self._opened_at >= self.cooldown:
+            self.state = self.HALF_OPEN
+            self._trial_at = None
+        # a trial that never reported back (cancelled, timed out) is replaced
+        if self.state == self.HALF_OPEN and (self._trial_at is None or now - self._trial_at >= self.cooldown):
+            self._trial_at = now
+            return True
+        return False
+
+    def retry_in(self) -> float:
+        return max(0.0, self._opened_at + self.cooldown - time.monotonic())
+
+    def success(self):
+        self.failures = 0
+        self.state = self.CLOSED
+
+    def failure(self) -> bool:
+        """Record a failure; True if this opened the circuit."""
+        self.failures += 1
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.threshold):
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+            return True
+        return False
+
+
+class CircuitBreakers:
+    """One breaker per endpoint class, created on first use."""
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, key: str) -> CircuitBreaker:
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = self._breakers[key] = CircuitBreaker(self.threshold, self.cooldown)
+        return breaker
+
+    def states(self) -> Dict[str, str]:
+        return {key: b.state for key, b in self._breakers.items()}
+
+
+class LatencyWindow:
+    """The last ``size`` latencies of one endpoint, for percentile lookups."""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered: List[float] = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Delay used right after an IP change or a failed cycle, and for how many cycles.
+POLL_FAST_INTERVAL = float(os.environ.get("POLL_FAST_INTERVAL", "60"))
+POLL_FAST_CYCLES = int(os.environ.get("POLL_FAST_CYCLES", "5"))
+# Ceiling the delay backs off to while the IP stays the same. Unset (0) keeps the
+# interval configured in the UI, so backoff is opt-in.
+POLL_MAX_INTERVAL = float(os.environ.get("POLL_MAX_INTERVAL", "0"))
+POLL_BACKOFF = float(os.environ.get("POLL_BACKOFF", "1.5"))
+# +/- fraction of random spread so many instances don't poll in lockstep.
+POLL_JITTER = float(os.environ.get("POLL_JITTER", "0.1"))
+
+
+class PollScheduler:
+    """Chooses how long SyncEngine sleeps between scheduled cycles.
+
+    After a change or a failure it polls every ``fast_interval`` for
+    ``fast_cycles`` cycles; while nothing changes the delay grows from the
+    configured ``interval`` by ``backoff`` per quiet cycle up to ``ceiling``
+    (never below ``interval``, so the default ceiling of 0 disables backoff).
+    ``wake`` re-evaluates a sleep in progress, e.g. after a settings change.
+    """
+
+    def __init__(
+        self,
+        interval: float,
+        ceiling: float = POLL_MAX_INTERVAL,
+        fast_interval: float = POLL_FAST_INTERVAL,
+        fast_cycles: int = POLL_FAST_CYCLES,
+        backoff: float = POLL_BACKOFF,
+        jitter: float = POLL_JITTER,
+    ):
+        self.interval = interval
+        self.ceiling = ceiling
+        self.fast_interval = fast_interval
+        self.fast_cycles = fast_cycles
+        self.backoff = max(1.0, backoff)
+        self.jitter = max(0.0, min(jitter, 0.5))
+        self._fast_left = 0
+        self._quiet = 0
+        self._wake: Optional[asyncio.Event] = None
+
+    def copy(self) -> "PollScheduler":
+        """A scheduler with the same settings and no history yet."""
+        return PollScheduler(self.interval, self.ceiling, self.fast_interval, self.fast_cycles, self.backoff, self.jitter)
+
+    def set_interval(self, interval: float):
+        if interval == self.interval:
+            return
+        self.interval = interval
+        self._quiet = 0
+        self.wake()
+
+    def record(self, changed: bool, failed: bool):
+        if changed or failed:
+            self._fast_left = self.fast_cycles
+            self._quiet = 0
+        elif self._fast_left:
+            self._fast_left -= 1
+        else:
+            self._quiet += 1
+
+    def base_delay(self) -> float:
+        if self._fast_left:
+            return min(self.fast_interval, self.interval)
+        ceiling = max(self.ceiling, self.interval)
+        return min(self.interval * self.backoff ** self._quiet, ceiling)
+
+    def next_delay(self) -> float:
+        spread = 1 + random.uniform(-self.jitter, self.jitter)
+        return self.base_delay() * spread
+
+    def wake(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    async def wait(self):
+        """Sleep until the next cycle is due; returns early if a wake shortens it."""
+        if self._wake is None:
+            self._wake = asyncio.Event()
+        started = time.monotonic()
+        delay = self.next_delay()
+        while True:
+            remaining = started + delay - time.monotonic()
+            if remaining <= 0:
+                return
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                return
+            # settings changed while asleep: re-plan from when the sleep began
+            delay = self.next_delay()
+            logger.debug("Scheduler woken, next sync in %.0fs", max(0.0, started + delay - time.monotonic()))
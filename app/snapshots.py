@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Seconds a zone snapshot is trusted before the next background refresh.
+SNAPSHOT_TTL = float(os.environ.get("SNAPSHOT_TTL", "900"))
+SNAPSHOT_TYPES = ("A", "AAAA")
+
+
+class ZoneSnapshot:
+    """Remote A/AAAA records of one zone, keyed by record id."""
+
+    def __init__(self, zone_id: str, records: Dict[str, Dict[str, Any]]):
+        self.zone_id = zone_id
+        self.records = records
+        self.fetched_at = time.monotonic()
+
+    def age(self) -> float:
+        return time.monotonic() - self.fetched_at
+
+
+class ZoneSnapshotCache:
+    """Per-zone cache of remote records used for drift detection and browsing.
+
+    Refreshing a zone costs one paginated listing; records we write ourselves
+    are folded in with ``apply`` so the cache stays current between refreshes.
+    """
+
+    def __init__(self, ttl: float = SNAPSHOT_TTL, types: Iterable[str] = SNAPSHOT_TYPES):
+        self.ttl = ttl
+        self.types = tuple(types)
+        self._zones: Dict[str, ZoneSnapshot] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def fresh(self, zone_id: str) -> Optional[ZoneSnapshot]:
+        snap = self._zones.get(zone_id)
+        if snap is not None and snap.age() < self.ttl:
+            return snap
+        return None
+
+    def lookup(self, zone_id: str, record_id: str) -> Optional[Dict[str, Any]]:
+        """Return the cached remote record if its zone snapshot is fresh."""
+        snap = self.fresh(zone_id)
+        return snap.records.get(record_id) if snap is not None else None
+
+    async def get(self, cf, zone_id: str) -> ZoneSnapshot:
+        return self.fresh(zone_id) or await self.refresh(cf, zone_id)
+
+    async def refresh(self, cf, zone_id: str) -> ZoneSnapshot:
+        # concurrent refreshes of one zone share a single listing
+        task = self._inflight.get(zone_id)
+        if task is None or task.done():
+            task = asyncio.ensure_future(self._fetch(cf, zone_id))
+            self._inflight[zone_id] = task
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if task.done() and self._inflight.get(zone_id) is task:
+                del self._inflight[zone_id]
+
+    async def _fetch(self, cf, zone_id: str) -> ZoneSnapshot:
+        records = {rec["id"]: rec async for rec in cf.iter_records(zone_id, types=self.types, prefetch=True)}
+        previous = self._zones.get(zone_id)
+        if previous is not None:
+            changed = [
+                rid for rid, rec in records.items()
+                if rid not in previous.records or previous.records[rid].get("modified_on") != rec.get("modified_on")
+            ]
+            if changed:
+                logger.info("Zone %s: %d records changed since last snapshot", zone_id, len(changed))
+        snap = ZoneSnapshot(zone_id, records)
+        self._zones[zone_id] = snap
+        return snap
+
+    def apply(self, zone_id: str, records: Iterable[Dict[str, Any]]):
+        """Fold records returned by our own writes into the zone snapshot."""
+        snap = self._zones.get(zone_id)
+        if snap is None:
+            return
+        for rec in records:
+            if rec.get("id"):
+                snap.records[rec["id"]] = rec
+
+    def invalidate(self, zone_id: Optional[str] = None):
+        if zone_id is None:
+            self._zones.clear()
+        else:
+            self._zones.pop(zone_id, None)
+
+    def zones(self) -> List[str]:
+        return list(self._zones)
@@ -0,0 +1,82 @@
+"""Cached status snapshot shared by ``/api/status`` and the SSE stream.
+
+Producers (the sync engine, the leader coordinator, config routes) call
+``publish``; readers get the current snapshot without doing any work. The
+snapshot is serialised once per change, and every SSE subscriber waits on the
+same event, so the cost does not grow with the number of open dashboards.
+"""
+import asyncio
+import json
+import time
+from typing import Any, Callable, Dict, Optional
+
+
+class StatusHub:
+    def __init__(self, extra: Optional[Callable[[], Dict[str, Any]]] = None):
+        # ``extra`` adds cheap derived fields (token, record count) on publish
+        self._extra = extra
+        self._fields: Dict[str, Any] = {}
+        self._state: Dict[str, Any] = {}
+        self._snapshot: Dict[str, Any] = {}
+        self._payload = "{}"
+        self.version = 0
+        self._changed = asyncio.Event()
+        self.refresh()
+
+    def publish(self, **fields) -> bool:
+        """Merge ``fields`` into the snapshot; wakes subscribers if anything changed."""
+        if all(self._fields.get(k, object()) == v for k, v in fields.items()):
+            return False
+        self._fields.update(fields)
+        return self.refresh()
+
+    def refresh(self) -> bool:
+        """Recompute the snapshot, e.g. after a config change."""
+        state = dict(self._fields)
+        if self._extra is not None:
+            state.update(self._extra())
+        if state == self._state and self.version:
+            return False
+        self._state = state
+        self._snapshot = dict(state, updated_at=time.time())
+        self._payload = json.dumps(self._snapshot, default=str)
+        self.version += 1
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+        return True
+
+    def snapshot(self) -> Dict[str, Any]:
+        return self._snapshot
+
+    def payload(self) -> str:
+        return self._payload
+
+    async def wait(self, version: int, timeout: Optional[float] = None) -> bool:
+        """Wait until the snapshot is newer than ``version``; False on timeout."""
+        if self.version > version:
+            return True
+        changed = self._changed
+        try:
+            await asyncio.wait_for(changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def stream(self, keepalive: float = 15.0, lifetime: float = 60.0):
+        """Yield Server-Sent Events: the current snapshot, then every change.
+
+        Ends after ``lifetime`` seconds so open dashboards never hold up a
+        server shutdown; EventSource reconnects after the ``retry`` delay.
+        """
+        ends_at = time.monotonic() + lifetime
+        version = self.version
+        yield "retry: 5000\ndata: %s\n\n" % self._payload
+        while True:
+            left = ends_at - time.monotonic()
+            if left <= 0:
+                return
+            if await self.wait(version, min(keepalive, left)):
+                version = self.version
+                yield "data: %s\n\n" % self._payload
+            elif time.monotonic() < ends_at:
+                yield ": keepalive\n\n"
@@ -0,0 +1,342 @@
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# "json" keeps config.json/records.json, "sqlite" uses ddns.sqlite3 in WAL mode.
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "json").lower()
+# Seconds to coalesce changes before the JSON backend writes them to disk.
+WRITE_DELAY = float(os.environ.get("CONFIG_WRITE_DELAY", "1.0"))
+
+Snapshot = Callable[[], Dict[str, Any]]
+
+
+def _atomic_write_json(path: str, data: Dict[str, Any]):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def enable_wal(db: sqlite3.Connection, attempts: int = 50):
+    """Switch ``db`` to WAL mode, waiting out other processes doing the same.
+
+    On a new database the switch needs an exclusive lock, and sqlite reports
+    "database is locked" at once instead of using the busy timeout, so workers
+    starting together would crash here.
+    """
+    for attempt in range(attempts):
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            return
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e) or attempt == attempts - 1:
+                raise
+            time.sleep(0.05)
+
+
+def _read_json(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class _DebouncedWriter:
+    """Writes JSON files from a timer thread, at most once per ``delay``.
+
+    ``schedule`` only marks a path dirty; the payload is produced by its
+    snapshot callback when the timer fires, so bursts of changes coalesce into
+    a single atomic write.
+    """
+
+    def __init__(self, delay: float, on_write: Optional[Callable[[str], None]] = None):
+        self.delay = delay
+        self._on_write = on_write
+        self._dirty: Dict[str, Snapshot] = {}
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+
+    def schedule(self, path: str, snapshot: Snapshot):
+        with self._lock:
+            self._dirty[path] = snapshot
+            if self.delay > 0:
+                if self._timer is None:
+                    self._timer = threading.Timer(self.delay, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            dirty, self._dirty = self._dirty, {}
+        for path, snapshot in dirty.items():
+            _atomic_write_json(path, snapshot())
+            if self._on_write is not None:
+                self._on_write(path)
+
+    @property
+    def pending(self) -> bool:
+        return bool(self._dirty)
+
+
+class StorageBackend:
+    """Persistence behind ConfigManager's in-memory model.
+
+    ConfigManager owns the live data and tells the backend what changed;
+    ``attach`` hands over snapshot callbacks for backends that can only
+    rewrite whole documents.
+    """
+
+    def attach(self, config_snapshot: Snapshot, records_snapshot: Snapshot):
+        self._config_snapshot = config_snapshot
+        self._records_snapshot = records_snapshot
+
+    def load(self) -> Tuple[Dict[str, Any], List[Tuple[str, Dict[str, Any]]]]:
+        """Return ``(config, records)``; config has ``token_encrypted`` and
+        ``settings``, records are ``(key, record)`` pairs."""
+        raise NotImplementedError
+
+    def changed(self) -> bool:
+        """True if another process wrote to the store since we last loaded it."""
+        return False
+
+    def put_setting(self, key: str, value: Any):
+        raise NotImplementedError
+
+    def delete_setting(self, key: str):
+        raise NotImplementedError
+
+    def put_record(self, key: str, record: Dict[str, Any]):
+        raise NotImplementedError
+
+    def update_record(self, key: str, fields: Dict[str, Any], record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Apply ``fields`` to a stored record; ``record`` is our copy with them applied.
+
+        Returns the record as stored, which may include other processes'
+        changes, or None if it no longer exists.
+        """
+        self.put_record(key, record)
+        return record
+
+    def delete_record(self, key: str):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class JsonStorage(StorageBackend):
+    """``config.json`` + ``records.json``, rewritten whole by a debounced writer."""
+
+    def __init__(self, data_dir: str, write_delay: float = WRITE_DELAY):
+        self.config_path = os.path.join(data_dir, "config.json")
+        self.records_path = os.path.join(data_dir, "records.json")
+        self._writer = _DebouncedWriter(write_delay, on_write=self._seen)
+        self._mtimes: Dict[str, int] = {}
+        os.makedirs(data_dir, exist_ok=True)
+        if not os.path.exists(self.config_path):
+            _atomic_write_json(self.config_path, {"token_encrypted": None, "settings": {}})
+        if not os.path.exists(self.records_path):
+            _atomic_write_json(self.records_path, {"records": []})
+
+    def _seen(self, path: str):
+        try:
+            self._mtimes[path] = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            self._mtimes.pop(path, None)
+
+    def load(self):
+        for path in (self.config_path, self.records_path):
+            self._seen(path)
+        config = _read_json(self.config_path)
+        config.setdefault("settings", {})
+        # the file is always rewritten whole, so keys only need to last until the next load
+        records = _read_json(self.records_path).get("records", [])
+        return config, [(rec.get("record_id") or uuid.uuid4().hex, rec) for rec in records]
+
+    def changed(self):
+        # our own unflushed changes win; they are about to overwrite the file anyway
+        if self._writer.pending:
+            return False
+        for path in (self.config_path, self.records_path):
+            try:
+                if os.stat(path).st_mtime_ns != self._mtimes.get(path):
+                    return True
+            except FileNotFoundError:
+                continue
+        return False
+
+    def put_setting(self, key, value):
+        self._writer.schedule(self.config_path, self._config_snapshot)
+
+    def delete_setting(self, key):
+        self._writer.schedule(self.config_path, self._config_snapshot)
+
+    def put_record(self, key, record):
+        self._writer.schedule(self.records_path, self._records_snapshot)
+
+    def delete_record(self, key):
+        self._writer.schedule(self.records_path, self._records_snapshot)
+
+    def flush(self):
+        self._writer.flush()
+
+
+class SqliteStorage(StorageBackend):
+    """SQLite in WAL mode with one row per record and per setting.
+
+    On first open an existing ``config.json``/``records.json`` pair is
+    imported once; the JSON files are left in place untouched.
+    """
+
+    def __init__(self, data_dir: str, filename: str = "ddns.sqlite3"):
+        os.makedirs(data_dir, exist_ok=True)
+        self.data_dir = data_dir
+        self.path = os.path.join(data_dir, filename)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        enable_wal(self._db)
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._data_version = None
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS records (
+                key TEXT PRIMARY KEY,
+                zone_id TEXT,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS records_zone ON records(zone_id);
+            CREATE TABLE IF NOT EXISTS settings (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            """
+        )
+        self._migrate_json()
+
+    def _migrate_json(self):
+        if self._db.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+            return
+        config_path = os.path.join(self.data_dir, "config.json")
+        records_path = os.path.join(self.data_dir, "records.json")
+        count = 0
+        with self._lock:
+            # workers start together; the write lock makes one of them migrate
+            # and the others see its marker once they get the lock
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                if self._db.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+                    self._db.execute("COMMIT")
+                    return
+                if os.path.exists(config_path):
+                    config = _read_json(config_path)
+                    self._put_setting("token_encrypted", config.get("token_encrypted"))
+                    for key, value in (config.get("settings") or {}).items():
+                        self._put_setting(key, value)
+                if os.path.exists(records_path):
+                    for rec in _read_json(records_path).get("records", []):
+                        self._put_record(rec.get("record_id") or uuid.uuid4().hex, rec)
+                        count += 1
+                self._db.execute("INSERT INTO meta(key, value) VALUES ('json_migrated', '1')")
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        if count:
+            logger.info("Migrated %d records from %s into %s", count, records_path, self.path)
+
+    def _put_setting(self, key: str, value: Any):
+        self._db.execute(
+            "INSERT INTO settings(key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, json.dumps(value)),
+        )
+
+    def _put_record(self, key: str, record: Dict[str, Any]):
+        self._db.execute(
+            "INSERT INTO records(key, zone_id, data) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET zone_id = excluded.zone_id, data = excluded.data",
+            (key, record.get("zone_id"), json.dumps(record)),
+        )
+
+    def _version(self) -> int:
+        # bumps whenever another connection commits, never for our own writes
+        return self._db.execute("PRAGMA data_version").fetchone()[0]
+
+    def changed(self):
+        with self._lock:
+            return self._data_version is not None and self._version() != self._data_version
+
+    def load(self):
+        with self._lock:
+            self._data_version = self._version()
+            settings = {k: json.loads(v) for k, v in self._db.execute("SELECT key, value FROM settings")}
+            records = [(k, json.loads(d)) for k, d in self._db.execute("SELECT key, data FROM records ORDER BY rowid")]
+        return {"token_encrypted": settings.pop("token_encrypted", None), "settings": settings}, records
+
+    def put_setting(self, key, value):
+        with self._lock:
+            self._put_setting(key, value)
+
+    def delete_setting(self, key):
+        with self._lock:
+            self._db.execute("DELETE FROM settings WHERE key = ?", (key,))
+
+    def put_record(self, key, record):
+        with self._lock:
+            self._put_record(key, record)
+
+    def update_record(self, key, fields, record):
+        # merge into the row as stored, not our copy: it may be a poll behind
+        # another worker's edit of a different field
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute("SELECT data FROM records WHERE key = ?", (key,)).fetchone()
+                merged = dict(json.loads(row[0]), **fields) if row else None
+                if merged is not None:
+                    self._put_record(key, merged)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return merged
+
+    def delete_record(self, key):
+        with self._lock:
+            self._db.execute("DELETE FROM records WHERE key = ?", (key,))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def make_storage(data_dir: str, backend: str = STORAGE_BACKEND, write_delay: float = WRITE_DELAY) -> StorageBackend:
+    if backend == "sqlite":
+        return SqliteStorage(data_dir)
+    if backend != "json":
+        logger.warning("Unknown STORAGE_BACKEND %r, falling back to json", backend)
+    return JsonStorage(data_dir, write_delay=write_delay)
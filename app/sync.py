@@ -2,92 +2,445 @@ import asyncio
 import logging
 import os
 import time
-from typing import Dict, List
-import httpx
-
-from .config import ConfigManager
-from .cloudflare_client import CloudflareClient
-from .ip_detect import detect_wan_ip
-
-LOG_DIR = os.path.join(os.environ.get("DATA_DIR", "/data"), "logs")
-os.makedirs(LOG_DIR, exist_ok=True)
-logger = logging.getLogger("cf_ddns")
-fh = logging.FileHandler(os.path.join(LOG_DIR, "sync.log"))
-formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
-fh.setFormatter(formatter)
-logger.addHandler(fh)
-logger.setLevel(logging.INFO)
+from typing import Dict, List, Optional
+
+from . import metrics
+from .config import DEFAULT_ACCOUNT, ConfigManager, account_of
+from .cloudflare_client import BATCH_SIZE, CloudflareAccounts, CloudflareClientManager
+from .history import SyncHistory
+from .ip_detect import WanIpDetector, primary_ip
+from .jobs import SyncJob, SyncJobQueue
+from .netwatch import AddressChangeSource, AddressWatcher
+from .resilience import deadline
+from .scheduler import PollScheduler
+from .snapshots import ZoneSnapshotCache
+from .status import StatusHub
+
+SYNC_CONCURRENCY = int(os.environ.get("SYNC_CONCURRENCY", "8"))
+SYNC_ZONE_CONCURRENCY = int(os.environ.get("SYNC_ZONE_CONCURRENCY", "4"))
+SYNC_USE_BATCH = os.environ.get("SYNC_USE_BATCH", "true").lower() in ("true", "1", "on", "yes")
+# Cloudflare calls of one cycle give up after this many seconds, so a
+# degraded upstream can't hold the cycle (and the next one) hostage.
+SYNC_CYCLE_DEADLINE = float(os.environ.get("SYNC_CYCLE_DEADLINE", "120"))
+
+# which detected address each record type is pointed at
+RECORD_FAMILIES = {"A": 4, "AAAA": 6}
+
+logger = logging.getLogger(__name__)
+
+
+def record_address(rec: Dict, addresses: Dict[int, Optional[str]]) -> Optional[str]:
+    """The detected address of ``rec``'s family, or None if there is none."""
+    return addresses.get(RECORD_FAMILIES.get(rec.get("type") or "A"))
+
 
 class SyncEngine:
-    def __init__(self, cfg: ConfigManager, interval: int = 300):
+    def __init__(
+        self,
+        cfg: ConfigManager,
+        interval: int = 300,
+        clients: Optional[CloudflareClientManager] = None,
+        concurrency: int = SYNC_CONCURRENCY,
+        zone_concurrency: int = SYNC_ZONE_CONCURRENCY,
+        use_batch: bool = SYNC_USE_BATCH,
+        batch_size: int = BATCH_SIZE,
+        detector: Optional[WanIpDetector] = None,
+        snapshots: Optional[ZoneSnapshotCache] = None,
+        address_source: Optional[AddressChangeSource] = None,
+        scheduler: Optional[PollScheduler] = None,
+        status: Optional[StatusHub] = None,
+        accounts: Optional[CloudflareAccounts] = None,
+        cycle_deadline: Optional[float] = SYNC_CYCLE_DEADLINE,
+        history: Optional[SyncHistory] = None,
+    ):
         self.cfg = cfg
-        self.interval = interval
+        self.scheduler = scheduler or PollScheduler(interval)
+        # per account, copied from ``scheduler`` when its loop starts
+        self._schedulers: Dict[str, PollScheduler] = {}
+        self.concurrency = max(1, concurrency)
+        self.zone_concurrency = max(1, zone_concurrency)
+        self.use_batch = use_batch
+        self.batch_size = batch_size
+        self.cycle_deadline = cycle_deadline
+        # one client pool and rate limiter per Cloudflare account
+        self._owns_clients = accounts is None
+        self.accounts = accounts or CloudflareAccounts(cfg.load_token)
+        if clients is not None:
+            self.accounts.add(DEFAULT_ACCOUNT, clients)
+        self._owns_detector = detector is None
+        self.detector = detector or WanIpDetector()
+        self.snapshots = snapshots or ZoneSnapshotCache()
+        self.watcher = AddressWatcher(address_source, self._on_address_change) if address_source else None
+        self.last_ip: Optional[str] = None
+        self.last_addresses: Dict[int, Optional[str]] = {}
+        self.last_success: Optional[float] = None
+        self.status = status or StatusHub()
+        self.history = history
+        # every run, scheduled or requested, goes through here; runs of one
+        # account never overlap, and accounts don't wait for each other
+        self.jobs = SyncJobQueue(self._run_once, on_update=self._publish_job, keys=self._sync_accounts)
         self._task = None
+        self._snapshot_task = None
         self._running = False
 
+    @property
+    def clients(self) -> CloudflareClientManager:
+        """Client manager of the default account."""
+        return self.accounts.manager(DEFAULT_ACCOUNT)
+
+    @property
+    def interval(self) -> float:
+        return self.scheduler.interval
+
+    @interval.setter
+    def interval(self, value: float):
+        # wakes a sleeping loop so the new setting applies right away
+        self.scheduler.set_interval(value)
+        for scheduler in list(self._schedulers.values()):
+            scheduler.set_interval(value)
+
+    def _sync_accounts(self) -> List[str]:
+        """Accounts with a token or tracked records; each syncs on its own."""
+        names = set(self.cfg.list_accounts())
+        names.update(account_of(r) for r in self.cfg.load_records().get("records", []))
+        return sorted(names) or [DEFAULT_ACCOUNT]
+
     async def start(self):
         if self._running:
             return
         self._running = True
         self._task = asyncio.create_task(self._loop())
+        self._snapshot_task = asyncio.create_task(self._snapshot_loop())
+        if self.watcher is not None:
+            try:
+                await self.watcher.start()
+            except OSError as e:
+                logger.warning("Could not watch interface addresses: %s", e)
+                self.watcher = None
 
     async def stop(self):
         self._running = False
-        if self._task:
-            self._task.cancel()
-            try:
-                await self._task
-            except asyncio.CancelledError:
-                pass
+        if self.watcher is not None:
+            await self.watcher.stop()
+        for task in (self._task, self._snapshot_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        await self.jobs.cancel()
+        if self._owns_clients:
+            await self.accounts.close()
+        if self._owns_detector:
+            await self.detector.close()
 
     async def _loop(self):
+        # one schedule per account, so an account that stalls only delays itself;
+        # accounts added later are picked up within an interval
+        loops: Dict[str, asyncio.Task] = {}
+        try:
+            while self._running:
+                for account in self._sync_accounts():
+                    if account not in loops or loops[account].done():
+                        loops[account] = asyncio.create_task(self._account_loop(account))
+                await self.scheduler.wait()
+        finally:
+            for task in loops.values():
+                task.cancel()
+            await asyncio.gather(*loops.values(), return_exceptions=True)
+
+    async def _account_loop(self, account: str):
+        scheduler = self._schedulers[account] = self.scheduler.copy()
+        try:
+            while self._running and account in self._sync_accounts():
+                job = await self.jobs.run("schedule", key=account)
+                changed = any(r["status"] == "updated" for r in job.results.values())
+                scheduler.record(changed=changed, failed=job.status == "failed")
+                await scheduler.wait()
+        finally:
+            self._schedulers.pop(account, None)
+
+    def _publish_job(self, job: SyncJob):
+        self.status.publish(
+            syncing=self.jobs.running,
+            last_job=job.to_dict(),
+            last_success=self.last_success,
+        )
+
+    def _on_address_change(self):
+        # the cached WAN IP is exactly what may have just changed
+        self.detector.invalidate()
+        # a sync already running may have looked up the IP before the change
+        self.jobs.trigger("address-change", rerun=True)
+
+    async def _snapshot_loop(self):
+        # slower than the sync loop: snapshots only steer which records get writes
         while self._running:
             try:
-                await self._run_once()
+                await self.refresh_snapshots()
             except Exception as e:
-                logger.exception("Sync loop error: %s", e)
-            await asyncio.sleep(self.interval)
+                logger.exception("Snapshot refresh error: %s", e)
+            await asyncio.sleep(self.snapshots.ttl)
 
-    async def _run_once(self):
-        token = self.cfg.load_token()
-        if not token:
+    async def refresh_snapshots(self):
+        """Re-list every zone that has tracked records, accounts in parallel."""
+        zones: Dict[str, set] = {}
+        for rec in self.cfg.load_records().get("records", []):
+            if rec.get("zone_id"):
+                zones.setdefault(account_of(rec), set()).add(rec.get("zone_id"))
+
+        async def refresh_account(account: str, zone_ids: set):
+            cf = await self.accounts.get(account)
+            if cf is None:
+                return
+            for zone_id in zone_ids:
+                try:
+                    await self.snapshots.refresh(cf, zone_id)
+                except Exception as e:
+                    logger.warning("Snapshot refresh of zone %s (account %s) failed: %s", zone_id, account, e)
+
+        await asyncio.gather(*(refresh_account(a, z) for a, z in zones.items()))
+
+    async def _run_once(self, job: Optional[SyncJob] = None):
+        job = job or SyncJob("direct")
+        started = time.monotonic()
+        try:
+            with deadline(self.cycle_deadline):
+                await self._run_cycle(job)
+        except Exception as e:
+            self._record_history(job, started, str(e))
+            raise
+        self._record_history(job, started)
+
+    def _record_history(self, job: SyncJob, started: float, error: Optional[str] = None):
+        """Append the cycle and every record it touched to the sync history."""
+        if self.history is None:
+            return
+        changes = []
+        counts = {"updated": 0, "skipped": 0, "failed": 0}
+        for record_id, result in job.results.items():
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+            if result["status"] == "skipped":
+                continue
+            rec = self.cfg.get_record(record_id) or {}
+            changes.append({
+                "record_id": record_id,
+                "name": result.get("name"),
+                "type": rec.get("type"),
+                "account": account_of(rec),
+                "zone_id": rec.get("zone_id"),
+                "old_ip": result.get("old_ip"),
+                "new_ip": result.get("new_ip"),
+                "status": result["status"],
+                "latency_ms": result.get("latency_ms"),
+                "error": result.get("error"),
+            })
+        error = error or job.error
+        cycle = {
+            "ts": job.created_at,
+            "job_id": job.id,
+            "reason": job.reason,
+            "status": "failed" if error or counts["failed"] else "done",
+            "duration_ms": round((time.monotonic() - started) * 1000, 1),
+            "ip": job.ip,
+            "ipv6": job.ipv6,
+            "error": error,
+            **counts,
+        }
+        try:
+            self.history.add_cycle(cycle, changes)
+        except Exception as e:
+            logger.warning("Could not write sync history: %s", e)
+
+    async def _run_cycle(self, job: Optional[SyncJob] = None):
+        # detected even without a token so the dashboard can show the address
+        with metrics.timed(metrics.SYNC_PHASE_SECONDS, phase="detect"):
+            addresses = await self.detector.get_addresses()
+        ip = primary_ip(addresses)
+        if ip:
+            logger.info("Detected WAN IP: %s", ", ".join(a for a in addresses.values() if a))
+            self.last_ip = ip
+            self.last_addresses = addresses
+            self.status.publish(wan_ip=ip, wan_ipv6=addresses.get(6))
+            if job:
+                job.ip = ip
+                job.ipv6 = addresses.get(6)
+        names = {DEFAULT_ACCOUNT} | {account_of(r) for r in self.cfg.load_records().get("records", [])}
+        clients = {name: await self.accounts.get(name) for name in names}
+        if not any(clients.values()):
             logger.info("No Cloudflare token configured; skipping sync")
+            if job:
+                job.message = "No Cloudflare token configured"
             return
-        cf = CloudflareClient(token)
-        async with httpx.AsyncClient() as client:
-            ip = await detect_wan_ip(client)
         if not ip:
             logger.warning("Could not detect WAN IP")
-            await cf.close()
+            metrics.SYNC_CYCLES.inc(result="no_ip")
+            if job:
+                job.error = "Could not detect WAN IP"
             return
-        logger.info(f"Detected WAN IP: {ip}")
 
-        data = self.cfg.load_records()
-        records = data.get("records", [])
-        updated_any = False
-        
-        for rec in records:
+        with metrics.timed(metrics.SYNC_PHASE_SECONDS, phase="diff"):
+            pending, in_sync, unavailable, previous = self._diff(addresses, job.key if job else None)
+        if job:
+            job.total = len(pending)
+            for rec in in_sync:
+                job.record(rec.get("record_id"), rec.get("name"), "skipped")
+            for rec in unavailable:
+                job.record(
+                    rec.get("record_id"), rec.get("name"), "skipped",
+                    "no IPv%d address detected" % RECORD_FAMILIES.get(rec.get("type") or "A", 4),
+                )
+
+        with metrics.timed(metrics.SYNC_PHASE_SECONDS, phase="update"):
+            by_account: Dict[str, List[Dict]] = {}
+            for rec in pending:
+                by_account.setdefault(account_of(rec), []).append(rec)
+            results = await asyncio.gather(*(
+                self._sync_account(account, clients.get(account), recs, addresses, job) for account, recs in by_account.items()
+            ))
+            updated = [record_id for done in results for record_id in done]
+            if job:
+                for rec in pending:
+                    result = job.results.get(rec.get("record_id"))
+                    if result is not None:
+                        result.update(old_ip=previous.get(rec.get("record_id")), new_ip=record_address(rec, addresses))
+
+        with metrics.timed(metrics.SYNC_PHASE_SECONDS, phase="persist"):
+            targets = {r.get("record_id"): record_address(r, addresses) for r in pending + in_sync}
+            # records that already matched remotely only need our copy fixed
+            stale = [r.get("record_id") for r in in_sync if r.get("content") != targets[r.get("record_id")]]
+            for record_id in updated + stale:
+                self.cfg.update_record(record_id, content=targets[record_id])
+
+        failed = len(pending) - len(updated)
+        skipped = len(in_sync) + len(unavailable)
+        for outcome, count in (("updated", len(updated)), ("skipped", skipped), ("failed", failed)):
+            metrics.SYNC_RECORDS.inc(count, outcome=outcome)
+            metrics.SYNC_LAST_CYCLE_RECORDS.set(count, outcome=outcome)
+        metrics.SYNC_CYCLES.inc(result="failed" if failed else "ok")
+        if not failed:
+            self.last_success = time.time()
+            metrics.mark_sync_success()
+
+    async def _sync_account(
+        self, account: str, cf, pending: List[Dict], addresses: Dict[int, Optional[str]], job: Optional[SyncJob] = None,
+    ) -> List[str]:
+        """Update one account's records with that account's client and limits."""
+        if cf is None:
+            logger.error("No token configured for account %s; %d records not updated", account, len(pending))
+            if job:
+                for rec in pending:
+                    job.record(rec.get("record_id"), rec.get("name"), "failed", "no token for account %s" % account)
+            return []
+        if self.use_batch:
+            return await self._batch_update_records(cf, pending, addresses, job)
+        return await self._update_records(cf, pending, addresses, job)
+
+    def _diff(self, addresses: Dict[int, Optional[str]], account: Optional[str] = None):
+        """Split auto-update records (of ``account``, or all) into those needing
+        a write, those already on their family's address, and those whose
+        family wasn't detected.
+
+        Also returns what each pending record currently points at, by record id.
+        """
+        pending, in_sync, unavailable, previous = [], [], [], {}
+        for rec in self.cfg.load_records().get("records", []):
             if not rec.get("auto_update"):
                 continue
+            if account is not None and account_of(rec) != account:
+                continue
+            ip = record_address(rec, addresses)
+            if ip is None:
+                # e.g. AAAA without IPv6 connectivity: writing the IPv4 would be wrong
+                logger.debug("Record %s skipped: no %s address", rec.get('name'), rec.get('type'))
+                unavailable.append(rec)
+                continue
+            # prefer what Cloudflare actually serves over our last write
+            remote = self.snapshots.lookup(rec.get("zone_id"), rec.get("record_id"))
+            actual = remote.get("content") if remote else rec.get("content")
+            if remote and actual != rec.get("content"):
+                logger.warning("Record %s drifted: stored %s, Cloudflare has %s", rec.get('name'), rec.get('content'), actual)
+            if actual == ip:
+                logger.debug("Record %s already matches %s", rec.get('name'), ip)
+                in_sync.append(rec)
+            else:
+                pending.append(rec)
+                previous[rec.get("record_id")] = actual
+        return pending, in_sync, unavailable, previous
+
+    async def _batch_update_records(
+        self, cf, pending: List[Dict], addresses: Dict[int, Optional[str]], job: Optional[SyncJob] = None,
+    ) -> List[str]:
+        """Point ``pending`` at their family's address with one batch call per zone chunk.
+
+        Returns the ids of the records that were updated.
+        """
+        by_zone: Dict[str, List[Dict]] = {}
+        for rec in pending:
+            by_zone.setdefault(rec.get("zone_id"), []).append(rec)
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def update_zone(zone_id: str, recs: List[Dict]) -> List[str]:
+            patches = [{"id": rec.get("record_id"), "content": record_address(rec, addresses)} for rec in recs]
+            async with slots:
+                started = time.monotonic()
+                try:
+                    result, errors = await cf.batch_update_records(zone_id, patches, chunk_size=self.batch_size)
+                except Exception as e:
+                    logger.exception("Failed to update zone %s: %s", zone_id, e)
+                    result, errors = {}, {patch["id"]: str(e) or type(e).__name__ for patch in patches}
+                latency_ms = round((time.monotonic() - started) * 1000, 1)
+            self.snapshots.apply(zone_id, result.values())
+            done = []
+            for rec in recs:
+                record_id = rec.get("record_id")
+                error = None
+                if record_id in result:
+                    done.append(record_id)
+                    logger.info("Updated %s -> %s", rec.get('name'), record_address(rec, addresses))
+                else:
+                    error = errors.get(record_id) or "not updated"
+                    logger.error("Failed to update %s: %s", rec.get('name'), error)
+                if job:
+                    job.record(record_id, rec.get("name"), "failed" if error else "updated", error, latency_ms=latency_ms)
+            return done
+
+        results = await asyncio.gather(*(update_zone(z, recs) for z, recs in by_zone.items()))
+        return [record_id for done in results for record_id in done]
+
+    async def _update_records(
+        self, cf, pending: List[Dict], addresses: Dict[int, Optional[str]], job: Optional[SyncJob] = None,
+    ) -> List[str]:
+        """Point every record in ``pending`` at its family's address with bounded parallelism.
+
+        At most ``concurrency`` updates run at once overall and at most
+        ``zone_concurrency`` per zone; request pacing is left to the client's
+        shared rate limiter. Returns the ids of the records that were updated.
+        """
+        global_slots = asyncio.Semaphore(self.concurrency)
+        zone_slots: Dict[str, asyncio.Semaphore] = {}
+
+        async def update(rec: Dict) -> Optional[str]:
             zone_id = rec.get("zone_id")
-            record_id = rec.get("record_id")
             name = rec.get("name")
-            record_type = rec.get("type")
-            current = rec.get("content")
-            if current == ip:
-                logger.info(f"Record {name} already matches {ip}")
-                continue
-            try:
-                updated = await cf.update_record(zone_id, record_id, ip, name=name, record_type=record_type)
-                rec["content"] = ip
-                updated_any = True
-                logger.info(f"Updated {name} -> {ip}")
-            except Exception as e:
-                logger.exception(f"Failed to update {name}: {e}")
-        
-        if updated_any:
-            self.cfg.save_records(data)
-        
-        await cf.close()
-        self.cfg.save_records({"records": records})
-        await cf.close()
+            ip = record_address(rec, addresses)
+            zone_sem = zone_slots.setdefault(zone_id, asyncio.Semaphore(self.zone_concurrency))
+            # take the zone slot first so a task never parks on a global slot
+            async with zone_sem, global_slots:
+                started = time.monotonic()
+                try:
+                    updated = await cf.update_record(zone_id, rec.get("record_id"), ip, name=name, record_type=rec.get("type"))
+                except Exception as e:
+                    logger.exception("Failed to update %s: %s", name, e)
+                    if job:
+                        job.record(rec.get("record_id"), name, "failed", str(e), latency_ms=round((time.monotonic() - started) * 1000, 1))
+                    return None
+            self.snapshots.apply(zone_id, [updated])
+            logger.info("Updated %s -> %s", name, ip)
+            if job:
+                job.record(rec.get("record_id"), name, "updated", latency_ms=round((time.monotonic() - started) * 1000, 1))
+            return rec.get("record_id")
+
+        results = await asyncio.gather(*(update(rec) for rec in pending))
+        return [record_id for record_id in results if record_id]
@@ -0,0 +1,89 @@
+"""Headless sync worker: ``python -m app``.
+
+Runs the SyncEngine without FastAPI, Jinja2 or the templates, for sidecars
+and small boxes where startup time and memory matter. ``run_once`` does a
+single sync and returns, which suits cron. The long-running worker goes
+through ``SyncCoordinator`` so it can share a data dir with the web UI.
+"""
+import asyncio
+import logging
+import os
+import signal
+from typing import Optional
+
+from .cloudflare_client import CloudflareAccounts
+from .config import DATA_DIR, ConfigManager
+from .history import SyncHistory
+from .ip_detect import WanIpDetector
+from .leader import SyncCoordinator
+from .netwatch import make_address_source
+from .sync import SyncEngine
+
+logger = logging.getLogger(__name__)
+
+CONFIG_SECRET = os.environ.get("CONFIG_SECRET")
+
+
+def build_engine(
+    cfg: ConfigManager,
+    accounts: CloudflareAccounts,
+    detector: WanIpDetector,
+    watch: bool = True,
+    history: Optional[SyncHistory] = None,
+) -> SyncEngine:
+    return SyncEngine(
+        cfg,
+        interval=cfg.load_polling_interval(),
+        accounts=accounts,
+        detector=detector,
+        address_source=make_address_source() if watch else None,
+        history=history,
+    )
+
+
+async def run_once(
+    cfg: ConfigManager,
+    accounts: Optional[CloudflareAccounts] = None,
+    detector: Optional[WanIpDetector] = None,
+) -> bool:
+    """Run one sync cycle; True if it succeeded."""
+    accounts = accounts or CloudflareAccounts(cfg.load_token)
+    detector = detector or WanIpDetector()
+    history = SyncHistory(cfg.data_dir)
+    try:
+        engine = build_engine(cfg, accounts, detector, watch=False, history=history)
+        job = await engine.jobs.run("once")
+        if job.error:
+            logger.error("Sync failed: %s", job.error)
+        return job.status == "done"
+    finally:
+        await accounts.close()
+        await detector.close()
+        history.close()
+        cfg.flush()
+
+
+async def run_forever(cfg: ConfigManager, data_dir: str = DATA_DIR):
+    """Run the sync loop until SIGINT/SIGTERM."""
+    accounts = CloudflareAccounts(cfg.load_token)
+    detector = WanIpDetector()
+    history = SyncHistory(data_dir)
+    coordinator = SyncCoordinator(cfg, build_engine(cfg, accounts, detector, history=history), data_dir)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: Ctrl+C still raises KeyboardInterrupt
+    await coordinator.start()
+    logger.info("Sync worker started (pid %d)", os.getpid())
+    try:
+        await stop.wait()
+    finally:
+        logger.info("Sync worker stopping")
+        await coordinator.stop()
+        await accounts.close()
+        await detector.close()
+        history.close()
+        cfg.flush()
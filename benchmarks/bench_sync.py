@@ -0,0 +1,93 @@
+"""Offline benchmark of SyncEngine._run_once against the fake Cloudflare API.
+
+Every tracked record starts on an old IP, so each case measures one full
+failover: IP detection, diff, updates and bookkeeping.
+
+    python -m benchmarks.bench_sync
+    python -m benchmarks.bench_sync --records 10 1000 --zones 1 20 --latency 0.02 --no-batch
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import tracemalloc
+
+# keep config, records and logs out of /data
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="cf-ddns-bench-"))
+
+import httpx
+
+from app.cloudflare_client import CloudflareClientManager
+from app.config import ConfigManager
+from app.ip_detect import WanIpDetector
+from app.ratelimit import TokenBucket
+from app.sync import SyncEngine
+from tests.fake_cloudflare import FakeCloudflare, fake_ip_app
+
+OLD_IP = "192.0.2.1"
+NEW_IP = "198.51.100.7"
+
+
+async def run_case(records: int, zones: int, latency: float, batch: bool, rate: float, snapshots: bool) -> dict:
+    fake = FakeCloudflare(latency=latency)
+    tracked = []
+    for i in range(records):
+        zone_id = f"zone{i % zones}"
+        rec = fake.add_record(zone_id, f"rec{i}", OLD_IP)
+        tracked.append({"zone_id": zone_id, "record_id": rec["id"], "name": rec["name"], "type": "A", "content": OLD_IP, "auto_update": True})
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        cfg = ConfigManager(data_dir=data_dir, write_delay=3600)
+        cfg.add_records(tracked)
+        clients = CloudflareClientManager(
+            lambda: fake.token,
+            transport=httpx.ASGITransport(app=fake.app),
+            rate_limiter=TokenBucket(rate, rate) if rate else None,
+        )
+        ip_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_ip_app(NEW_IP)))
+        engine = SyncEngine(cfg, clients=clients, detector=WanIpDetector(client=ip_client), use_batch=batch)
+        if snapshots:
+            await engine.refresh_snapshots()
+        fake.requests.clear()
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        await engine._run_once()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        updated = sum(1 for r in cfg.load_records()["records"] if r.get("content") == NEW_IP)
+        await clients.close()
+        await ip_client.aclose()
+        cfg.flush()
+    return {
+        "records": records,
+        "zones": zones,
+        "wall_ms": elapsed * 1000,
+        "requests": fake.request_count,
+        "updated": updated,
+        "peak_kib": peak / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--zones", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every fake API response")
+    parser.add_argument("--rate", type=float, default=0.0, help="client rate limit in req/s (0 = unlimited)")
+    parser.add_argument("--no-batch", dest="batch", action="store_false", help="use per-record updates")
+    parser.add_argument("--snapshots", action="store_true", help="refresh zone snapshots before the measured run")
+    args = parser.parse_args()
+
+    print(f"{'records':>8} {'zones':>6} {'wall_ms':>10} {'requests':>9} {'updated':>8} {'peak_kib':>10}")
+    for zones in args.zones:
+        for records in args.records:
+            r = asyncio.run(run_case(records, zones, args.latency, args.batch, args.rate, args.snapshots))
+            print(f"{r['records']:>8} {r['zones']:>6} {r['wall_ms']:>10.1f} {r['requests']:>9} {r['updated']:>8} {r['peak_kib']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+import os
+import tempfile
+
+# keep config, records and logs out of /data
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="cf-ddns-test-"))
+
+import httpx  # noqa: E402
+from app.cloudflare_client import CloudflareClientManager  # noqa: E402
+from app.config import ConfigManager  # noqa: E402
+from app.ip_detect import WanIpDetector  # noqa: E402
+from app.sync import SyncEngine  # noqa: E402
+from tests.fake_cloudflare import fake_ip_app  # noqa: E402
+
+# shared by the engine tests (test_sync, test_snapshots)
+OLD_IP = "192.0.2.1"
+NEW_IP = "198.51.100.7"
+
+
+def make_engine(fake, tmp_path, records, **kwargs):
+    cfg = ConfigManager(data_dir=str(tmp_path), write_delay=0)
+    cfg.add_records(records)
+    if "accounts" not in kwargs:
+        kwargs["clients"] = CloudflareClientManager(lambda: fake.token, transport=httpx.ASGITransport(app=fake.app))
+    if "detector" not in kwargs:
+        kwargs["detector"] = WanIpDetector(client=httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_ip_app(NEW_IP))))
+    return SyncEngine(cfg, **kwargs)
+
+
+def tracked(fake, zone_id, record_id, content=OLD_IP, auto_update=True):
+    rec = fake.add_record(zone_id, record_id, content)
+    return {"zone_id": zone_id, "record_id": record_id, "name": rec["name"], "type": "A", "content": content, "auto_update": auto_update}
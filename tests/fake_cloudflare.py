@@ -0,0 +1,188 @@
+"""In-process stand-in for the parts of the Cloudflare v4 API we call.
+
+``FakeCloudflare().app`` is an ASGI app; point ``CloudflareClient`` at it with
+``transport=httpx.ASGITransport(app=fake.app)``. Faults can be injected per
+instance: fixed ``latency``, the next N responses as 429 (``throttle``) or 5xx
+(``fail``). ``fake_ip_app`` answers the trace/ipify/ifconfig lookups the same
+way so IP detection works offline.
+"""
+import asyncio
+import itertools
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import httpx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+
+from app.cloudflare_client import CloudflareClient
+
+PREFIX = "/client/v4"
+
+
+class FakeCloudflare:
+    def __init__(self, token: str = "test-token", latency: float = 0.0, retry_after: int = 0):
+        self.token = token
+        self.latency = latency
+        self.retry_after = retry_after
+        self.zones: Dict[str, Dict[str, Any]] = {}
+        self.records: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.requests: Counter = Counter()
+        # JSON bodies of the writes, as (endpoint kind, body)
+        self.bodies: List[Any] = []
+        self._throttle = 0
+        self._fail = 0
+        self._clock = itertools.count(1)
+        self.app = Starlette(routes=[
+            Route(PREFIX + "/zones", self._list_zones),
+            Route(PREFIX + "/zones/{zone_id}/dns_records", self._list_records),
+            Route(PREFIX + "/zones/{zone_id}/dns_records/batch", self._batch, methods=["POST"]),
+            Route(PREFIX + "/zones/{zone_id}/dns_records/{record_id}", self._record, methods=["GET", "PUT", "PATCH"]),
+        ])
+
+    # -- fixtures ----------------------------------------------------------
+
+    def add_zone(self, zone_id: str, name: Optional[str] = None) -> Dict[str, Any]:
+        zone = {"id": zone_id, "name": name or f"{zone_id}.example.com"}
+        self.zones[zone_id] = zone
+        self.records.setdefault(zone_id, {})
+        return zone
+
+    def add_record(self, zone_id: str, record_id: str, content: str, type: str = "A", proxied: bool = False) -> Dict[str, Any]:
+        zone = self.zones.get(zone_id) or self.add_zone(zone_id)
+        rec = {
+            "id": record_id,
+            "zone_id": zone_id,
+            "name": f"{record_id}.{zone['name']}",
+            "type": type,
+            "content": content,
+            "proxied": proxied,
+            "ttl": 1,
+            "modified_on": self._stamp(),
+        }
+        self.records[zone_id][record_id] = rec
+        return rec
+
+    def throttle(self, count: int = 1):
+        """Answer the next ``count`` requests with 429."""
+        self._throttle += count
+
+    def fail(self, count: int = 1):
+        """Answer the next ``count`` requests with 503."""
+        self._fail += count
+
+    def client(self, **kwargs) -> CloudflareClient:
+        return CloudflareClient(self.token, transport=httpx.ASGITransport(app=self.app), **kwargs)
+
+    @property
+    def request_count(self) -> int:
+        return sum(self.requests.values())
+
+    # -- plumbing ----------------------------------------------------------
+
+    def _stamp(self) -> str:
+        return f"2024-01-01T00:00:{next(self._clock):09d}Z"
+
+    async def _gate(self, request: Request, kind: str) -> Optional[JSONResponse]:
+        self.requests[f"{request.method} {kind}"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if request.headers.get("authorization") != f"Bearer {self.token}":
+            return _error(403, 9109, "Invalid access token")
+        if self._throttle:
+            self._throttle -= 1
+            return JSONResponse(_envelope(None, False, [{"code": 10000, "message": "rate limited"}]),
+                                status_code=429, headers={"Retry-After": str(self.retry_after)})
+        if self._fail:
+            self._fail -= 1
+            return _error(503, 10001, "service unavailable")
+        return None
+
+    @staticmethod
+    def _page(request: Request, items: List[Dict[str, Any]]) -> JSONResponse:
+        per_page = int(request.query_params.get("per_page", 20))
+        page = int(request.query_params.get("page", 1))
+        chunk = items[(page - 1) * per_page: page * per_page]
+        total_pages = max(1, -(-len(items) // per_page))
+        info = {"page": page, "per_page": per_page, "count": len(chunk), "total_count": len(items), "total_pages": total_pages}
+        return JSONResponse(dict(_envelope(chunk), result_info=info))
+
+    # -- endpoints ---------------------------------------------------------
+
+    async def _list_zones(self, request: Request):
+        return await self._gate(request, "zones") or self._page(request, list(self.zones.values()))
+
+    async def _list_records(self, request: Request):
+        denied = await self._gate(request, "dns_records")
+        if denied:
+            return denied
+        zone_id = request.path_params["zone_id"]
+        if zone_id not in self.zones:
+            return _error(404, 7003, "Could not route to zone")
+        items = list(self.records[zone_id].values())
+        rtype = request.query_params.get("type")
+        if rtype:
+            items = [r for r in items if r["type"] == rtype]
+        return self._page(request, items)
+
+    async def _record(self, request: Request):
+        denied = await self._gate(request, "dns_record")
+        if denied:
+            return denied
+        rec = self.records.get(request.path_params["zone_id"], {}).get(request.path_params["record_id"])
+        if rec is None:
+            return _error(404, 81044, "Record does not exist")
+        if request.method == "GET":
+            return JSONResponse(_envelope(rec))
+        body = await request.json()
+        self.bodies.append(("dns_record", body))
+        if request.method == "PUT" and not {"type", "name", "content"} <= set(body):
+            return _error(400, 9000, "PUT requires type, name and content")
+        self._apply(rec, body)
+        return JSONResponse(_envelope(rec))
+
+    async def _batch(self, request: Request):
+        denied = await self._gate(request, "batch")
+        if denied:
+            return denied
+        zone = self.records.get(request.path_params["zone_id"], {})
+        body = await request.json()
+        self.bodies.append(("batch", body))
+        patches = body.get("patches", [])
+        # batches are atomic: one bad id rejects the whole call
+        missing = [p.get("id") for p in patches if p.get("id") not in zone]
+        if missing:
+            return _error(400, 81044, f"Records do not exist: {missing}")
+        result = [self._apply(zone[p["id"]], p) for p in patches]
+        return JSONResponse(_envelope({"patches": result}))
+
+    def _apply(self, rec: Dict[str, Any], fields: Dict[str, Any]) -> Dict[str, Any]:
+        for key in ("content", "name", "type", "proxied", "ttl"):
+            if key in fields:
+                rec[key] = fields[key]
+        rec["modified_on"] = self._stamp()
+        return rec
+
+
+def _envelope(result: Any, success: bool = True, errors: Optional[list] = None) -> Dict[str, Any]:
+    return {"success": success, "errors": errors or [], "messages": [], "result": result}
+
+
+def _error(status: int, code: int, message: str) -> JSONResponse:
+    return JSONResponse(_envelope(None, False, [{"code": code, "message": message}]), status_code=status)
+
+
+def fake_ip_app(ip: str, latency: float = 0.0) -> Starlette:
+    """Serve ``ip`` on the paths of the trace, ipify and ifconfig.co providers."""
+
+    async def trace(request: Request):
+        await asyncio.sleep(latency)
+        return PlainTextResponse(f"fl=1\nh=cloudflare.com\nip={ip}\nts=0\n")
+
+    async def plain(request: Request):
+        await asyncio.sleep(latency)
+        return PlainTextResponse(ip + "\n")
+
+    return Starlette(routes=[Route("/cdn-cgi/trace", trace), Route("/", plain), Route("/ip", plain)])
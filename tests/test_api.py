@@ -0,0 +1,123 @@
+import json
+
+import httpx
+import pytest
+import pytest_asyncio
+from app import main
+from app.cloudflare_client import CloudflareClientManager
+from tests.fake_cloudflare import FakeCloudflare
+
+
+@pytest_asyncio.fixture
+async def api():
+    """The app wired to a FakeCloudflare as its default account (startup not run)."""
+    fake = FakeCloudflare()
+    manager = CloudflareClientManager(lambda: fake.token, transport=httpx.ASGITransport(app=fake.app))
+    main.cf_accounts.add("default", manager)
+    main.cfg.save_token(fake.token)
+    main.zone_snapshots.invalidate()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+        yield fake, client
+    for rec in main.cfg.load_records()["records"]:
+        main.cfg.delete_record(rec["record_id"])
+    main.zone_snapshots.invalidate()
+    main.cfg.delete_account("default")
+    await main.cf_accounts.discard("default")
+
+
+@pytest.mark.asyncio
+async def test_zone_records_are_served_from_a_fresh_snapshot(api):
+    fake, client = api
+    fake.add_record("z0", "r0", "192.0.2.1")
+    fake.add_record("z0", "r1", "2001:db8::1", type="AAAA")
+
+    first = await client.get("/api/zones/z0/records")
+    again = await client.get("/api/zones/z0/records")
+
+    assert first.status_code == again.status_code == 200
+    assert {r["id"] for r in again.json()["records"]} == {"r0", "r1"}
+    assert fake.requests["GET dns_records"] == 1
+
+
+def track(fake, zone_id, record_id, proxied=False):
+    rec = fake.add_record(zone_id, record_id, "192.0.2.1", proxied=proxied)
+    main.cfg.add_record({"zone_id": zone_id, "record_id": record_id, "name": rec["name"], "type": "A",
+                         "content": rec["content"], "auto_update": True})
+
+
+@pytest.mark.asyncio
+async def test_proxy_statuses_cost_one_listing_per_zone(api):
+    fake, client = api
+    track(fake, "z0", "r0", proxied=True)
+    track(fake, "z0", "r1")
+    track(fake, "z1", "r2")
+
+    resp = await client.get("/api/records/proxy")
+
+    assert resp.json() == {"zones": {"z0": {"r0": True, "r1": False}, "z1": {"r2": False}}}
+    assert fake.requests["GET dns_records"] == 2
+    assert fake.requests["GET dns_record"] == 0
+
+    only = await client.get("/api/records/proxy", params={"record_ids": "r2"})
+    assert only.json() == {"zones": {"z1": {"r2": False}}}
+    assert fake.requests["GET dns_records"] == 2  # snapshots still fresh
+
+
+@pytest.mark.asyncio
+async def test_bulk_proxy_uses_one_batch_per_zone_and_reports_failures(api):
+    fake, client = api
+    for zone_id, record_id in (("z0", "r0"), ("z0", "r1"), ("z1", "r2")):
+        track(fake, zone_id, record_id)
+
+    resp = await client.patch("/api/records/proxy", json={"record_ids": ["r0", "r1", "r2", "nope"], "proxied": True})
+
+    body = resp.json()
+    assert sorted(body["updated"]) == ["r0", "r1", "r2"] and body["failed"] == ["nope"] and body["ok"] is False
+    assert body["errors"] == {"nope": "not a tracked record"}
+    assert fake.requests["POST batch"] == 2 and fake.requests["PATCH dns_record"] == 0
+    assert all(fake.records[z][r]["proxied"] for z, r in (("z0", "r0"), ("z0", "r1"), ("z1", "r2")))
+
+    # deleted in Cloudflare: the zone's batch is rejected and the record reported
+    track(fake, "z1", "r3")
+    del fake.records["z1"]["r3"]
+    resp = await client.patch("/api/records/proxy", json={"record_ids": ["r2", "r3"], "proxied": False})
+    assert resp.json()["failed"] == ["r3"]
+    assert resp.json()["errors"] == {"r3": "HTTP 404: Record does not exist"}
+    assert fake.records["z1"]["r2"]["proxied"] is False
+
+
+@pytest.mark.asyncio
+async def test_proxy_toggle_sends_one_patch_with_only_proxied(api):
+    fake, client = api
+    track(fake, "z0", "r0")
+
+    resp = await client.patch("/api/records/r0/proxy", params={"proxied": "true"})
+
+    assert resp.json() == {"ok": True, "proxied": True}
+    assert fake.request_count == fake.requests["PATCH dns_record"] == 1
+    assert fake.bodies == [("dns_record", {"proxied": True})]
+    assert fake.records["z0"]["r0"]["proxied"] is True
+
+
+@pytest.mark.asyncio
+async def test_forwarded_sync_now_points_at_the_leaders_running_job(api):
+    fake, client = api
+    assert not main.coordinator.is_leader
+    with open(main.coordinator.state_path, "w") as f:
+        json.dump({"last_job": {"id": "abc123", "status": "running", "created_at": 0}}, f)
+
+    resp = await client.post("/api/update-now")
+
+    assert resp.json() == {"ok": True, "job_id": "abc123", "forwarded": True}
+    assert (await client.get("/api/jobs/abc123")).json()["status"] == "running"
+
+
+@pytest.mark.asyncio
+async def test_unknown_account_is_rejected_without_creating_a_client(api):
+    fake, client = api
+
+    resp = await client.get("/api/zones", params={"account": "nope"})
+
+    assert resp.status_code == 404
+    assert "nope" not in main.cf_accounts._managers
+    assert (await client.get("/api/zones")).status_code == 200
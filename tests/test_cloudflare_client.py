@@ -1,10 +1,122 @@
 import asyncio
+import socket
+import time
+
+import httpx
 import pytest
-from app.cloudflare_client import CloudflareClient
+from app import metrics
+from app.cloudflare_client import CloudflareClient, CloudflareClientManager
+from app.resilience import CircuitBreakers, CircuitOpenError, DeadlineExceeded
+from tests.fake_cloudflare import FakeCloudflare
+
+@pytest.mark.asyncio
+async def test_invalid_token_raises(monkeypatch):
+    def no_network(*args, **kwargs):
+        raise AssertionError("request left the process")
+    monkeypatch.setattr(socket.socket, "connect", no_network)
+    monkeypatch.setattr(socket.socket, "connect_ex", no_network)
+    fake = FakeCloudflare()
+    client = CloudflareClient("invalid-token", transport=httpx.ASGITransport(app=fake.app))
+    with pytest.raises(httpx.HTTPStatusError) as e:
+        await client.list_zones()
+    assert e.value.response.status_code == 403
+    assert fake.requests == {"GET zones": 1}
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_circuit_opens_and_fails_fast(monkeypatch):
+    monkeypatch.setattr("app.cloudflare_client.BACKOFF_BASE", 0.001)
+    fake = FakeCloudflare()
+    fake.fail(100)
+    client = fake.client(breakers=CircuitBreakers(threshold=2, cooldown=60))
+    with pytest.raises(CircuitOpenError):
+        await client.list_zones()
+    with pytest.raises(CircuitOpenError):
+        await client.list_zones()
+    assert fake.request_count == 2
+    await client.close()
+
 
 @pytest.mark.asyncio
-async def test_invalid_token_raises():
-    client = CloudflareClient("invalid-token")
-    with pytest.raises(Exception):
+async def test_retry_after_beyond_the_deadline_fails_fast():
+    fake = FakeCloudflare(retry_after=30)
+    fake.throttle(1)
+    # built like production clients: with the manager's shared rate limiter
+    manager = CloudflareClientManager(lambda: fake.token, transport=httpx.ASGITransport(app=fake.app), deadline=3)
+    client = await manager.get()
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        await client.list_zones()
+    # and a second call doesn't sit out the pause the 429 left on the limiter
+    with pytest.raises(DeadlineExceeded):
         await client.list_zones()
+    assert time.monotonic() - started < 0.5
+    await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_rebuild_lets_the_old_client_finish_its_requests():
+    fake = FakeCloudflare(latency=0.2)
+    fake.add_zone("z1")
+    manager = CloudflareClientManager(lambda: fake.token, transport=httpx.ASGITransport(app=fake.app), retire_grace=0)
+    old = await manager.get()
+    listing = asyncio.ensure_future(old.list_zones())
+    await asyncio.sleep(0.05)
+    await manager.rebuild()
+    assert await manager.get() is not old
+    assert [z["id"] for z in await listing] == ["z1"]
+    # closed once the listing is done
+    await asyncio.sleep(0.05)
+    assert old._closed
+    await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_retired_client_stays_usable_for_its_grace_period():
+    fake = FakeCloudflare()
+    fake.add_zone("z1")
+    manager = CloudflareClientManager(lambda: fake.token, transport=httpx.ASGITransport(app=fake.app), retire_grace=60)
+    old = await manager.get()
+    await manager.rebuild()
+    # e.g. a sync cycle that fetched the client before the token was saved
+    assert [z["id"] for z in await old.list_zones()] == ["z1"]
+    await manager.close()
+    assert old._closed
+
+
+@pytest.mark.asyncio
+async def test_concurrent_gets_after_a_token_change_build_one_client():
+    fake = FakeCloudflare()
+    token = ["old-token"]
+    manager = CloudflareClientManager(lambda: token[0], transport=httpx.ASGITransport(app=fake.app), retire_grace=60)
+    old = await manager.get()
+    token[0] = "new-token"
+    async with manager._lock:  # e.g. a rebuild in progress
+        waiters = [asyncio.ensure_future(manager.get()) for _ in range(2)]
+        await asyncio.sleep(0)
+    first, second = await asyncio.gather(*waiters)
+    assert first is second and first.token == "new-token" and first is not old
+    assert len(manager._retiring) == 1
+    await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_slow_get_is_hedged():
+    calls = []
+
+    async def handler(request):
+        calls.append(request.url.path)
+        if len(calls) == 21:
+            await asyncio.sleep(2)
+        return httpx.Response(200, json={"success": True, "result": {"id": "r1"}})
+
+    client = CloudflareClient("t", transport=httpx.MockTransport(handler), hedge_percentile=0.9)
+    for _ in range(20):
+        await client.get_record("z1", "r1")
+    started = time.monotonic()
+    assert (await client.get_record("z1", "r1"))["id"] == "r1"
+    assert time.monotonic() - started < 1
+    assert len(calls) == 22
+    assert metrics.CF_HEDGED.value(endpoint="GET /zones/:id/dns_records/:id", result="won") >= 1
     await client.close()
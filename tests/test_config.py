@@ -0,0 +1,150 @@
+import json
+import multiprocessing
+from app.config import ConfigManager
+from app.storage import SqliteStorage
+
+def test_record_index_and_write_behind(tmp_path):
+    cfg = ConfigManager(data_dir=str(tmp_path), write_delay=60)
+    cfg.add_records([
+        {"zone_id": "z1", "record_id": "r1", "name": "a.example.com", "auto_update": False},
+        {"zone_id": "z2", "record_id": "r2", "name": "b.example.com", "auto_update": False},
+    ])
+    assert cfg.update_record("r1", auto_update=True)
+    assert not cfg.update_record("missing", auto_update=True)
+    assert [r["record_id"] for r in cfg.records_for_zone("z1")] == ["r1"]
+
+    # nothing reaches disk until the debounce fires or we flush
+    on_disk = json.loads((tmp_path / "records.json").read_text())
+    assert on_disk["records"] == []
+    cfg.flush()
+    on_disk = json.loads((tmp_path / "records.json").read_text())
+    assert [r["auto_update"] for r in on_disk["records"]] == [True, False]
+
+    reloaded = ConfigManager(data_dir=str(tmp_path))
+    assert reloaded.get_record("r2")["name"] == "b.example.com"
+
+def test_sqlite_backend_migrates_json_once(tmp_path):
+    (tmp_path / "config.json").write_text(json.dumps({"token_encrypted": "tok", "settings": {"polling_interval": 120}}))
+    (tmp_path / "records.json").write_text(json.dumps({"records": [{"zone_id": "z1", "record_id": "r1", "auto_update": False}]}))
+    cfg = ConfigManager(data_dir=str(tmp_path), storage=SqliteStorage(str(tmp_path)))
+    assert cfg.load_token() == "tok"
+    assert cfg.load_polling_interval() == 120
+    cfg.update_record("r1", auto_update=True)
+    cfg.storage.close()
+
+    # later JSON edits are not re-imported; the database is the source of truth now
+    (tmp_path / "records.json").write_text(json.dumps({"records": []}))
+    cfg = ConfigManager(data_dir=str(tmp_path), storage=SqliteStorage(str(tmp_path)))
+    assert cfg.get_record("r1")["auto_update"] is True
+    cfg.storage.close()
+
+def test_sqlite_update_keeps_other_workers_edits(tmp_path):
+    leader = ConfigManager(data_dir=str(tmp_path), storage=SqliteStorage(str(tmp_path)))
+    leader.add_record({"zone_id": "z1", "record_id": "r1", "content": "192.0.2.1", "auto_update": True})
+    follower = ConfigManager(data_dir=str(tmp_path), storage=SqliteStorage(str(tmp_path)))
+    follower.update_record("r1", auto_update=False)
+
+    # the leader hasn't reloaded yet and only changes the content
+    assert leader.update_record("r1", content="192.0.2.2")
+    assert leader.get_record("r1") == {"zone_id": "z1", "record_id": "r1", "content": "192.0.2.2", "auto_update": False}
+    follower.refresh()
+    assert follower.get_record("r1")["content"] == "192.0.2.2"
+
+    follower.delete_record("r1")
+    assert not leader.update_record("r1", content="192.0.2.3")
+    assert not leader.has_record("r1")
+    leader.storage.close()
+    follower.storage.close()
+
+def test_sqlite_records_without_an_id_keep_their_key(tmp_path):
+    cfg = ConfigManager(data_dir=str(tmp_path), storage=SqliteStorage(str(tmp_path)))
+    cfg.add_record({"zone_id": "z1", "name": "manual.example.com", "auto_update": False})
+    [key] = cfg._records
+    cfg.storage.close()
+
+    reloaded = ConfigManager(data_dir=str(tmp_path), storage=SqliteStorage(str(tmp_path)))
+    assert list(reloaded._records) == [key]
+    assert reloaded.update_record(key, auto_update=True)
+    _, rows = reloaded.storage.load()
+    assert rows == [(key, {"zone_id": "z1", "name": "manual.example.com", "auto_update": True})]
+    reloaded.storage.close()
+
+def _open_sqlite(data_dir, start):
+    start.wait()
+    SqliteStorage(data_dir).close()
+
+def test_sqlite_migration_is_safe_with_concurrent_workers(tmp_path):
+    records = [{"zone_id": "z1", "record_id": "r%d" % i} for i in range(200)]
+    (tmp_path / "config.json").write_text(json.dumps({"token_encrypted": "tok", "settings": {}}))
+    (tmp_path / "records.json").write_text(json.dumps({"records": records}))
+    start = multiprocessing.Event()
+    workers = [multiprocessing.Process(target=_open_sqlite, args=(str(tmp_path), start)) for _ in range(6)]
+    for w in workers:
+        w.start()
+    start.set()
+    for w in workers:
+        w.join(30)
+    assert [w.exitcode for w in workers] == [0] * len(workers)
+
+    storage = SqliteStorage(str(tmp_path))
+    _, loaded = storage.load()
+    assert len(loaded) == 200
+    storage.close()
+
+def test_accounts_keep_their_own_tokens(tmp_path):
+    cfg = ConfigManager(secret="s3cret", data_dir=str(tmp_path), write_delay=0)
+    assert cfg.list_accounts() == []
+    cfg.save_token("work-token", "work")
+    cfg.save_token("home-token")
+    cfg.add_records([
+        {"zone_id": "z1", "record_id": "r1", "auto_update": True},
+        {"zone_id": "z2", "record_id": "r2", "auto_update": True, "account": "work"},
+    ])
+    assert cfg.list_accounts() == ["default", "work"]
+    assert [r["record_id"] for r in cfg.records_for_account("work")] == ["r2"]
+
+    reloaded = ConfigManager(secret="s3cret", data_dir=str(tmp_path))
+    assert reloaded.load_token() == "home-token"
+    assert reloaded.load_token("work") == "work-token"
+    assert reloaded.delete_account("work") and not reloaded.delete_account("work")
+    assert reloaded.load_token("work") is None
+    assert reloaded.list_accounts() == ["default"]
+
+def test_sqlite_accounts_added_by_different_workers_are_kept(tmp_path):
+    one = ConfigManager(data_dir=str(tmp_path), storage=SqliteStorage(str(tmp_path)))
+    two = ConfigManager(data_dir=str(tmp_path), storage=SqliteStorage(str(tmp_path)))
+    one.save_token("work-token", "work")
+    two.save_token("home-token", "home")
+    one.save_token("old-token", "old")
+    two.refresh()
+    assert two.delete_account("old")
+
+    reloaded = ConfigManager(data_dir=str(tmp_path), storage=SqliteStorage(str(tmp_path)))
+    assert sorted(reloaded.list_accounts()) == ["home", "work"]
+    for cfg in (one, two, reloaded):
+        cfg.storage.close()
+
+def test_query_records_pages_filters_and_sorts(tmp_path):
+    cfg = ConfigManager(data_dir=str(tmp_path), write_delay=60)
+    cfg.add_records([
+        {"zone_id": "z%d" % (i % 2), "record_id": "r%d" % i, "name": "host%02d.example.com" % i, "auto_update": i % 3 == 0}
+        for i in range(20)
+    ])
+    seen, cursor = [], None
+    while True:
+        page = cfg.query_records(zone_id="z0", cursor=cursor, limit=3)
+        seen += [r["record_id"] for r in page["records"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+        # records added mid-walk don't shift the cursor
+        cfg.add_record({"zone_id": "z1", "record_id": "new%d" % len(seen), "name": "a.example.com"})
+    assert seen == ["r%d" % i for i in range(0, 20, 2)]
+    assert page["total"] == 10
+
+    page = cfg.query_records(name="HOST1", auto_update=True, sort="name", descending=True)
+    assert [r["record_id"] for r in page["records"]] == ["r18", "r15", "r12"]
+
+    revision = cfg.revision
+    cfg.update_record("r1", auto_update=True)
+    assert cfg.revision > revision
@@ -0,0 +1,39 @@
+import time
+
+from app.history import SyncHistory
+
+
+def change(record_id, new_ip, status="updated"):
+    return {"record_id": record_id, "name": record_id + ".example.com", "old_ip": "192.0.2.1", "new_ip": new_ip, "status": status}
+
+
+def test_changes_are_queried_by_record_time_and_cursor(tmp_path):
+    history = SyncHistory(str(tmp_path))
+    start = time.time() - 60
+    for i in range(5):
+        history.add_cycle({"ts": start + i, "status": "done", "updated": 2}, [change("r0", "198.51.100.%d" % i), change("r1", "x", "failed")])
+
+    page = history.changes(record_id="r0", limit=2)
+    assert [c["new_ip"] for c in page["items"]] == ["198.51.100.4", "198.51.100.3"]
+    older = history.changes(record_id="r0", cursor=page["next_cursor"], limit=10)
+    assert [c["new_ip"] for c in older["items"]] == ["198.51.100.2", "198.51.100.1", "198.51.100.0"]
+    assert older["next_cursor"] is None
+
+    window = history.changes(status="failed", since=start + 1, until=start + 3)["items"]
+    assert [c["ts"] for c in window] == [start + 2, start + 1]
+    assert len(history.cycles()["items"]) == 5
+    history.close()
+
+
+def test_prune_applies_retention_and_row_cap(tmp_path):
+    history = SyncHistory(str(tmp_path), retention_days=1, max_rows=3)
+    now = time.time()
+    for i in range(6):
+        history.add_cycle({"ts": now - 2 * 86400 + i * 3600 * 10, "status": "done"}, [change("r0", str(i))])
+
+    assert history.prune(now=now) > 0
+    # 0..2 are over a day old, and only the last 3 rows are kept anyway
+    assert [c["new_ip"] for c in history.changes()["items"]] == ["5", "4", "3"]
+    assert len(history.cycles()["items"]) == 3
+    history.close()
+
@@ -0,0 +1,60 @@
+import asyncio
+import pytest
+from app.ip_detect import WanIpDetector
+
+async def slow(client):
+    await asyncio.sleep(5)
+    return "198.51.100.1"
+
+async def fast(client):
+    await asyncio.sleep(0.01)
+    return "203.0.113.7"
+
+async def broken(client):
+    raise RuntimeError("provider down")
+
+@pytest.mark.asyncio
+async def test_first_answer_wins_and_is_cached():
+    calls = []
+
+    async def counted(client):
+        calls.append(1)
+        return await fast(client)
+
+    detector = WanIpDetector(client=object(), providers=[("slow", slow), ("fast", counted), ("broken", broken)])
+    results = await asyncio.gather(*(detector.get() for _ in range(3)))
+    assert results == ["203.0.113.7"] * 3
+    assert await detector.get() == "203.0.113.7"
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_families_are_probed_separately():
+    async def answer(client):
+        await asyncio.sleep(0.01)
+        return client  # each fake client "is" the address it would report
+
+    # the IPv6 side only reaches an IPv4 answer (e.g. a v4-only proxy), which doesn't count
+    detector = WanIpDetector(clients={4: "203.0.113.7", 6: "2001:db8::1"}, providers=[("echo", answer)])
+    assert await detector.get_addresses() == {4: "203.0.113.7", 6: "2001:db8::1"}
+    assert await detector.get() == "203.0.113.7"
+
+    v4_only = WanIpDetector(clients={4: "203.0.113.7", 6: "198.51.100.1"}, providers=[("echo", answer)])
+    assert await v4_only.get_addresses() == {4: "203.0.113.7", 6: None}
+
+
+
+@pytest.mark.asyncio
+async def test_invalidate_discards_a_lookup_already_in_flight():
+    answers = iter(["203.0.113.7", "203.0.113.8"])
+
+    async def changing(client):
+        await asyncio.sleep(0.02)
+        return next(answers)
+
+    detector = WanIpDetector(client=object(), providers=[("changing", changing)])
+    stale = asyncio.ensure_future(detector.get())
+    await asyncio.sleep(0)
+    detector.invalidate()  # the address changed while that lookup ran
+    assert await stale == "203.0.113.7"
+    assert await detector.get() == "203.0.113.8"
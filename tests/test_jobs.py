@@ -0,0 +1,84 @@
+import asyncio
+import pytest
+from app.jobs import SyncJobQueue
+
+@pytest.mark.asyncio
+async def test_concurrent_triggers_join_one_run():
+    runs = []
+    release = asyncio.Event()
+
+    async def runner(job):
+        runs.append(job.id)
+        job.total = 1
+        await release.wait()
+        job.record("r1", "a.example.com", "updated")
+
+    queue = SyncJobQueue(runner)
+    first = queue.trigger()
+    second = queue.trigger()
+    assert first is second
+    await asyncio.sleep(0)
+    assert first.status == "running"
+
+    release.set()
+    await queue.run()
+    assert runs == [first.id]
+    assert first.to_dict()["progress"] == {"done": 1, "total": 1}
+    assert first.status == "done"
+
+    # once finished, the next trigger starts a fresh run
+    assert queue.trigger() is not first
+
+
+@pytest.mark.asyncio
+async def test_rerun_trigger_mid_run_queues_one_more_run():
+    runs = []
+    release = asyncio.Event()
+
+    async def runner(job):
+        runs.append(job.reason)
+        if len(runs) == 1:
+            await release.wait()
+
+    queue = SyncJobQueue(runner)
+    first = queue.trigger("schedule")
+    await asyncio.sleep(0)
+    # the running sync already looked up its IP; the change needs a run of its own
+    assert queue.trigger("address-change", rerun=True) is first
+    assert queue.trigger("address-change", rerun=True) is first
+    release.set()
+    await queue.run()
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+    assert runs == ["schedule", "address-change"]
+    assert queue.latest.reason == "address-change" and queue.latest.status == "done"
+
+
+@pytest.mark.asyncio
+async def test_keys_run_on_their_own_and_groups_collect_them():
+    release = asyncio.Event()
+
+    async def runner(job):
+        if job.key == "slow":
+            await release.wait()
+        job.record("r-" + job.key, None, "updated")
+
+    queue = SyncJobQueue(runner, keys=lambda: ["fast", "slow"])
+    group = queue.trigger()
+    for _ in range(10):
+        await asyncio.sleep(0)
+    assert group.status == "running" and list(group.results) == ["r-fast"]
+
+    # "fast" isn't held up by "slow": it starts a new run, "slow" is joined
+    fast = await queue.run("manual", key="fast")
+    assert fast.reason == "manual" and fast.status == "done"
+    second = queue.trigger()
+    assert second is not group
+
+    release.set()
+    await queue.run()
+    for _ in range(10):
+        await asyncio.sleep(0)
+    assert group.status == "done" and sorted(group.results) == ["r-fast", "r-slow"]
+    assert second.status == "done"
@@ -0,0 +1,86 @@
+import errno
+import os
+
+import pytest
+from app.config import ConfigManager
+from app.jobs import SyncJobQueue
+from app.leader import SyncCoordinator
+from app.status import StatusHub
+
+class StubEngine:
+    def __init__(self):
+        self.running = False
+        self.runs = 0
+        self.interval = 300
+        self.last_ip = "203.0.113.7"
+        self.last_addresses = {4: "203.0.113.7"}
+        self.last_success = None
+        self.status = StatusHub()
+        self.jobs = SyncJobQueue(self._run_once)
+
+    async def start(self):
+        self.running = True
+
+    async def stop(self):
+        self.running = False
+
+    async def _run_once(self, job=None):
+        self.runs += 1
+
+@pytest.mark.asyncio
+async def test_single_leader_and_handover(tmp_path):
+    cfg = ConfigManager(data_dir=str(tmp_path), write_delay=0)
+    first = SyncCoordinator(cfg, StubEngine(), str(tmp_path))
+    second = SyncCoordinator(cfg, StubEngine(), str(tmp_path))
+
+    await first._tick()
+    await second._tick()
+    assert first.is_leader and first.engine.running
+    assert not second.is_leader and not second.engine.running
+    assert second.leader_state()["wan_ip"] == "203.0.113.7"
+
+    # a follower's "sync now" is picked up by the leader
+    assert second.request_sync() is None
+    await first._tick()
+    job = first.engine.jobs.latest
+    assert job.reason == "forwarded"
+    await first.engine.jobs.run()
+    assert first.engine.runs == 1
+    await first._tick()
+    assert second.get_job(job.id)["status"] == "done"
+
+    await first.stop()
+    await second._tick()
+    assert second.is_leader and second.engine.running
+    await second.stop()
+
+
+@pytest.mark.asyncio
+async def test_idle_leader_does_not_rewrite_its_state(tmp_path):
+    cfg = ConfigManager(data_dir=str(tmp_path), write_delay=0)
+    leader = SyncCoordinator(cfg, StubEngine(), str(tmp_path))
+    await leader._tick()
+    written = os.stat(leader.state_path).st_mtime_ns
+
+    for _ in range(3):
+        await leader._tick()
+    assert os.stat(leader.state_path).st_mtime_ns == written
+
+    leader.engine.last_ip = "203.0.113.8"
+    await leader._tick()
+    assert leader.leader_state()["wan_ip"] == "203.0.113.8"
+    await leader.stop()
+
+
+@pytest.mark.asyncio
+async def test_leads_without_a_lock_when_the_filesystem_has_no_flock(tmp_path, monkeypatch, caplog):
+    def no_locks(fd, op):
+        raise OSError(errno.ENOLCK, "No locks available")
+    monkeypatch.setattr("app.leader.fcntl.flock", no_locks)
+    cfg = ConfigManager(data_dir=str(tmp_path), write_delay=0)
+    coordinator = SyncCoordinator(cfg, StubEngine(), str(tmp_path))
+
+    await coordinator._tick()
+    assert coordinator.is_leader and coordinator.engine.running
+    assert "Cannot lock" in caplog.text
+    await coordinator.stop()
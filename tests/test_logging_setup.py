@@ -0,0 +1,58 @@
+import logging
+import logging.handlers
+import multiprocessing
+
+from app import logging_setup
+
+
+def test_parse_levels():
+    assert logging_setup.parse_levels("app.sync=debug, httpx=WARNING,,bad") == {"app.sync": "DEBUG", "httpx": "WARNING"}
+
+
+def test_records_go_through_the_queue_to_a_rotating_file(tmp_path):
+    root = logging.getLogger()
+    logging_setup.stop_logging()  # importing app.main in other tests configures it already
+    before = [h for h in root.handlers if not isinstance(h, logging.handlers.QueueHandler)], root.level
+    root.handlers[:] = before[0]
+    try:
+        listener = logging_setup.configure_logging("INFO", "tests.noisy=ERROR", str(tmp_path), max_bytes=200, backup_count=2)
+        assert any(isinstance(h, logging.handlers.QueueHandler) for h in root.handlers)
+        assert logging_setup.configure_logging("INFO", "", str(tmp_path)) is listener
+
+        for i in range(20):
+            logging.getLogger("tests.logging").info("line %d %s", i, "x" * 20)
+        logging.getLogger("tests.noisy").warning("dropped")
+        logging_setup.stop_logging()
+
+        files = sorted(p.name for p in tmp_path.iterdir())
+        assert files == ["sync.log", "sync.log.1", "sync.log.2", "sync.log.lock"]
+        text = "".join(p.read_text() for p in tmp_path.glob("sync.log*"))
+        assert "line 19" in text and "dropped" not in text
+    finally:
+        logging_setup.stop_logging()
+        root.handlers[:], level = before
+        root.setLevel(level)
+        logging.getLogger("tests.noisy").setLevel(logging.NOTSET)
+
+
+def _write_lines(path, worker, start):
+    handler = logging_setup.SharedRotatingFileHandler(path, maxBytes=500, backupCount=1000, encoding="utf-8")
+    start.wait()
+    for i in range(1000):
+        handler.emit(logging.makeLogRecord({"msg": "worker %d line %d" % (worker, i)}))
+    handler.close()
+
+
+def test_processes_sharing_the_log_file_lose_no_lines(tmp_path):
+    path = str(tmp_path / "sync.log")
+    start = multiprocessing.Event()
+    workers = [multiprocessing.Process(target=_write_lines, args=(path, n, start)) for n in range(4)]
+    for w in workers:
+        w.start()
+    start.set()
+    for w in workers:
+        w.join(30)
+    assert [w.exitcode for w in workers] == [0] * len(workers)
+
+    lines = [line for p in tmp_path.glob("sync.log*") if not p.name.endswith(".lock") for line in p.read_text().splitlines()]
+    assert sorted(lines) == sorted("worker %d line %d" % (n, i) for n in range(4) for i in range(1000))
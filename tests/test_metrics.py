@@ -0,0 +1,26 @@
+from app import metrics
+
+def test_histogram_renders_cumulative_buckets():
+    hist = metrics.Histogram("test_latency_seconds", "Test latency.", buckets=(0.1, 1.0))
+    hist.observe(0.05, endpoint="GET /zones")
+    hist.observe(0.5, endpoint="GET /zones")
+    hist.observe(5, endpoint="GET /zones")
+    text = metrics.render()
+    assert '# TYPE test_latency_seconds histogram' in text
+    assert 'test_latency_seconds_bucket{endpoint="GET /zones",le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{endpoint="GET /zones",le="1.0"} 2' in text
+    assert 'test_latency_seconds_bucket{endpoint="GET /zones",le="+Inf"} 3' in text
+    assert 'test_latency_seconds_count{endpoint="GET /zones"} 3' in text
+
+def test_timed_reports_to_tracers():
+    hist = metrics.Histogram("test_phase_seconds", "Test phase.")
+    spans = []
+    tracer = lambda name, labels, seconds: spans.append((name, labels))
+    metrics.add_tracer(tracer)
+    try:
+        with metrics.timed(hist, phase="detect"):
+            pass
+    finally:
+        metrics.remove_tracer(tracer)
+    assert spans == [("test_phase_seconds", {"phase": "detect"})]
+    assert hist.count(phase="detect") == 1
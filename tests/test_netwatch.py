@@ -0,0 +1,20 @@
+import asyncio
+import pytest
+from app.netwatch import AddressChangeSource, AddressWatcher
+
+class ManualSource(AddressChangeSource):
+    async def start(self, notify):
+        self.notify = notify
+
+@pytest.mark.asyncio
+async def test_bursts_of_events_trigger_one_callback():
+    calls = []
+    source = ManualSource()
+    watcher = AddressWatcher(source, lambda: calls.append(1), debounce=0.05)
+    await watcher.start()
+    for _ in range(5):
+        source.notify()
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.1)
+    assert calls == [1]
+    await watcher.stop()
@@ -0,0 +1,12 @@
+import asyncio
+import time
+import pytest
+from app.ratelimit import TokenBucket
+
+@pytest.mark.asyncio
+async def test_pause_blocks_all_waiters():
+    bucket = TokenBucket(rate=100, capacity=10)
+    bucket.pause(0.2)
+    start = time.monotonic()
+    await asyncio.gather(*(bucket.acquire() for _ in range(5)))
+    assert time.monotonic() - start >= 0.2
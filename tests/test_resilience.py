@@ -0,0 +1,28 @@
+import time
+
+from app.resilience import CircuitBreaker, deadline, deadline_at
+
+
+def test_breaker_half_opens_after_cooldown():
+    breaker = CircuitBreaker(threshold=2, cooldown=0.05)
+    assert not breaker.failure() and breaker.failure()
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()          # one trial call
+    assert not breaker.allow()
+    breaker.failure()               # trial failed: open again
+    assert breaker.state == CircuitBreaker.OPEN
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+
+def test_nested_deadline_never_extends_the_outer_one():
+    assert deadline_at() is None
+    with deadline(1):
+        outer = deadline_at()
+        with deadline(60):
+            assert deadline_at() == outer
+        assert deadline_at(0.1) < outer
+    assert deadline_at() is None
@@ -0,0 +1,32 @@
+import asyncio
+import time
+import pytest
+from app.scheduler import PollScheduler
+
+def test_backs_off_while_stable_and_speeds_up_after_change():
+    sched = PollScheduler(300, ceiling=1000, fast_interval=60, fast_cycles=2, backoff=2, jitter=0)
+    assert sched.next_delay() == 300
+    sched.record(changed=False, failed=False)
+    sched.record(changed=False, failed=False)
+    assert sched.next_delay() == 1000
+    sched.record(changed=True, failed=False)
+    assert sched.next_delay() == 60
+    sched.record(changed=False, failed=False)
+    sched.record(changed=False, failed=False)
+    assert sched.next_delay() == 300
+
+def test_default_ceiling_keeps_the_configured_interval():
+    sched = PollScheduler(300, jitter=0)
+    for _ in range(10):
+        sched.record(changed=False, failed=False)
+    assert sched.next_delay() == 300
+
+@pytest.mark.asyncio
+async def test_interval_change_wakes_sleeper():
+    sched = PollScheduler(60, jitter=0)
+    waiter = asyncio.ensure_future(sched.wait())
+    await asyncio.sleep(0.05)
+    start = time.monotonic()
+    sched.set_interval(0.01)
+    await asyncio.wait_for(waiter, timeout=1)
+    assert time.monotonic() - start < 0.5
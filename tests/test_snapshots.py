@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+from app.snapshots import ZoneSnapshotCache
+from tests.fake_cloudflare import FakeCloudflare
+from tests.conftest import NEW_IP, OLD_IP, make_engine, tracked
+
+
+@pytest.mark.asyncio
+async def test_record_already_on_the_ip_is_not_written(tmp_path):
+    fake = FakeCloudflare()
+    rec = tracked(fake, "z0", "r0")
+    fake.records["z0"]["r0"]["content"] = NEW_IP  # someone else already pointed it at the new IP
+    engine = make_engine(fake, tmp_path, [rec])
+    await engine.refresh_snapshots()
+
+    await engine._run_once()
+
+    assert fake.requests["POST batch"] == 0 and fake.requests["PATCH dns_record"] == 0
+    assert engine.cfg.get_record("r0")["content"] == NEW_IP  # our copy is fixed up
+    await engine.clients.close()
+
+
+@pytest.mark.asyncio
+async def test_out_of_band_change_shows_up_on_the_next_refresh(tmp_path):
+    fake = FakeCloudflare()
+    rec = tracked(fake, "z0", "r0", content=NEW_IP)
+    engine = make_engine(fake, tmp_path, [rec])
+    await engine.refresh_snapshots()
+    await engine._run_once()
+    assert fake.requests["POST batch"] == 0
+
+    # edited in the Cloudflare dashboard; the stored copy still says NEW_IP
+    fake._apply(fake.records["z0"]["r0"], {"content": OLD_IP})
+    assert engine.snapshots.lookup("z0", "r0")["content"] == NEW_IP
+    await engine.refresh_snapshots()
+    assert engine.snapshots.lookup("z0", "r0")["content"] == OLD_IP
+
+    await engine._run_once()
+
+    assert fake.requests["POST batch"] == 1
+    assert fake.records["z0"]["r0"]["content"] == NEW_IP
+    await engine.clients.close()
+
+
+@pytest.mark.asyncio
+async def test_fresh_snapshot_is_reused_and_concurrent_refreshes_share_a_listing():
+    fake = FakeCloudflare()
+    for i in range(3):
+        fake.add_record("z0", "r%d" % i, OLD_IP)
+    cf = fake.client()
+    cache = ZoneSnapshotCache(ttl=60)
+
+    first = await cache.get(cf, "z0")
+    assert await cache.get(cf, "z0") is first
+    assert fake.requests["GET dns_records"] == 1
+
+    cache.invalidate("z0")
+    snaps = await asyncio.gather(*(cache.refresh(cf, "z0") for _ in range(3)))
+    assert snaps[0] is snaps[1] is snaps[2]
+    assert fake.requests["GET dns_records"] == 2
+    await cf.close()
@@ -0,0 +1,56 @@
+import asyncio
+import json
+
+import pytest
+from app.status import StatusHub
+
+
+@pytest.mark.asyncio
+async def test_publish_only_wakes_subscribers_on_change():
+    settings = {"record_count": 0}
+    hub = StatusHub(lambda: dict(settings))
+    version = hub.version
+
+    assert hub.publish(wan_ip="198.51.100.7")
+    assert not hub.publish(wan_ip="198.51.100.7")
+    assert not hub.refresh()
+    assert hub.version == version + 1
+    assert await hub.wait(version, timeout=0)
+    assert not await hub.wait(hub.version, timeout=0.01)
+
+    settings["record_count"] = 3
+    assert hub.refresh()
+    assert hub.snapshot()["record_count"] == 3
+    assert json.loads(hub.payload())["wan_ip"] == "198.51.100.7"
+
+
+@pytest.mark.asyncio
+async def test_stream_sends_snapshot_then_changes():
+    hub = StatusHub()
+    hub.publish(wan_ip="192.0.2.1")
+    stream = hub.stream(keepalive=0.05)
+
+    first = await stream.__anext__()
+    assert json.loads(first.split("data: ", 1)[1])["wan_ip"] == "192.0.2.1"
+    assert await stream.__anext__() == ": keepalive\n\n"
+
+    pending = asyncio.ensure_future(stream.__anext__())
+    await asyncio.sleep(0)
+    hub.publish(wan_ip="192.0.2.2")
+    event = await asyncio.wait_for(pending, 1)
+    assert json.loads(event[len("data: "):])["wan_ip"] == "192.0.2.2"
+    await stream.aclose()
+
+
+@pytest.mark.asyncio
+async def test_stream_ends_after_its_lifetime():
+    hub = StatusHub()
+    events = []
+
+    async def consume():
+        async for event in hub.stream(keepalive=0.02, lifetime=0.1):
+            events.append(event)
+
+    await asyncio.wait_for(consume(), 1)
+    assert events[0].startswith("retry: 5000")
+    assert 1 <= events.count(": keepalive\n\n") <= 5
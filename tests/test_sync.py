@@ -0,0 +1,210 @@
+import asyncio
+
+import httpx
+import pytest
+from app.cloudflare_client import CloudflareAccounts, CloudflareClientManager
+from app.history import SyncHistory
+from app.ip_detect import WanIpDetector
+from app.scheduler import PollScheduler
+from tests.conftest import NEW_IP, OLD_IP, make_engine, tracked
+from tests.fake_cloudflare import FakeCloudflare, fake_ip_app
+
+@pytest.mark.asyncio
+async def test_run_once_batches_stale_records_per_zone(tmp_path):
+    fake = FakeCloudflare()
+    records = [tracked(fake, f"z{i % 2}", f"r{i}") for i in range(6)]
+    records.append(tracked(fake, "z0", "current", content=NEW_IP))
+    records.append(tracked(fake, "z1", "manual", auto_update=False))
+    engine = make_engine(fake, tmp_path, records)
+
+    await engine._run_once()
+
+    assert fake.requests["POST batch"] == 2
+    assert fake.requests["PATCH dns_record"] == 0
+    assert all(fake.records[f"z{i % 2}"][f"r{i}"]["content"] == NEW_IP for i in range(6))
+    assert fake.records["z1"]["manual"]["content"] == OLD_IP
+    assert engine.cfg.get_record("r0")["content"] == NEW_IP
+    await engine.clients.close()
+
+
+@pytest.mark.asyncio
+async def test_rejected_batch_falls_back_to_single_updates(tmp_path):
+    fake = FakeCloudflare()
+    records = [tracked(fake, "z0", f"r{i}") for i in range(3)]
+    del fake.records["z0"]["r1"]  # removed in Cloudflare behind our back
+    engine = make_engine(fake, tmp_path, records)
+
+    job = await engine.jobs.run("manual")
+
+    assert fake.requests["POST batch"] == 1
+    assert fake.requests["PATCH dns_record"] == 3
+    assert engine.cfg.get_record("r0")["content"] == NEW_IP
+    assert engine.cfg.get_record("r1")["content"] == OLD_IP
+    # the reason Cloudflare gave, not a generic message
+    assert job.results["r1"]["error"] == "HTTP 404: Record does not exist"
+    await engine.clients.close()
+
+
+@pytest.mark.asyncio
+async def test_listing_follows_pagination_and_retries_429():
+    fake = FakeCloudflare()
+    for i in range(120):
+        fake.add_zone(f"z{i:03d}")
+    fake.throttle(1)
+    cf = fake.client()
+
+    zones = await cf.list_zones()
+
+    assert len(zones) == 120
+    assert fake.requests["GET zones"] == 4  # one throttled + three pages
+    await cf.close()
+
+
+@pytest.mark.asyncio
+async def test_jobs_publish_status_snapshot(tmp_path):
+    fake = FakeCloudflare()
+    engine = make_engine(fake, tmp_path, [tracked(fake, "z0", "r0")])
+
+    job = await engine.jobs.run("manual")
+
+    status = engine.status.snapshot()
+    assert status["wan_ip"] == NEW_IP
+    assert status["syncing"] is False
+    assert status["last_job"]["id"] == job.id
+    assert status["last_job"]["results"]["r0"]["status"] == "updated"
+    assert status["last_success"] == engine.last_success
+    await engine.clients.close()
+
+
+@pytest.mark.asyncio
+async def test_records_sync_through_their_own_account(tmp_path):
+    home, work = FakeCloudflare("home-token"), FakeCloudflare("work-token")
+    records = [tracked(home, "z0", "r0"), dict(tracked(work, "z1", "r1"), account="work"),
+               dict(tracked(work, "z2", "r2"), account="gone")]
+    accounts = CloudflareAccounts(lambda account: None)
+    for name, fake in (("default", home), ("work", work)):
+        accounts.add(name, CloudflareClientManager(lambda fake=fake: fake.token, transport=httpx.ASGITransport(app=fake.app)))
+    engine = make_engine(home, tmp_path, records, accounts=accounts)
+    work.throttle(1)  # pauses only the work account's rate limiter
+
+    job = await engine.jobs.run("manual")
+
+    assert home.records["z0"]["r0"]["content"] == NEW_IP
+    assert work.records["z1"]["r1"]["content"] == NEW_IP
+    assert home.requests["POST batch"] == 1 and work.requests["POST batch"] == 2
+    assert job.results["r2"]["status"] == "failed"
+    assert job.results["r2"]["error"] == "no token for account gone"
+    assert accounts.manager("default")._client_kwargs["rate_limiter"] is not accounts.manager("work")._client_kwargs["rate_limiter"]
+    await accounts.close()
+
+
+@pytest.mark.asyncio
+async def test_a_slow_account_does_not_hold_up_the_others(tmp_path):
+    home, work = FakeCloudflare("home-token"), FakeCloudflare("work-token", latency=1.0)
+    records = [tracked(home, "z0", "r0"), dict(tracked(work, "z1", "r1"), account="work")]
+    accounts = CloudflareAccounts(lambda account: None)
+    for name, fake in (("default", home), ("work", work)):
+        accounts.add(name, CloudflareClientManager(lambda fake=fake: fake.token, transport=httpx.ASGITransport(app=fake.app)))
+    engine = make_engine(home, tmp_path, records, accounts=accounts)
+
+    first = engine.jobs.trigger("manual")
+    await asyncio.sleep(0.3)
+    assert home.records["z0"]["r0"]["content"] == NEW_IP
+    assert first.status == "running"
+    # the home account is free again, so a new request doesn't join the stuck one
+    home.records["z0"]["r0"]["content"] = OLD_IP
+    engine.cfg.update_record("r0", content=OLD_IP)
+    engine.snapshots.apply("z0", [home.records["z0"]["r0"]])
+    second = engine.jobs.trigger("manual")
+    assert second is not first
+    await asyncio.sleep(0.3)
+    assert home.records["z0"]["r0"]["content"] == NEW_IP
+    assert work.records["z1"]["r1"]["content"] == OLD_IP
+
+    await engine.jobs.run("manual")
+    assert work.records["z1"]["r1"]["content"] == NEW_IP
+    assert first.status == "done" and first.results["r1"]["status"] == "updated"
+    await accounts.close()
+
+
+@pytest.mark.asyncio
+async def test_each_account_polls_on_its_own_schedule(tmp_path):
+    home, work = FakeCloudflare("home-token"), FakeCloudflare("work-token", latency=2.0)
+    records = [tracked(home, "z0", "r0"), dict(tracked(work, "z1", "r1"), account="work")]
+    accounts = CloudflareAccounts(lambda account: None)
+    for name, fake in (("default", home), ("work", work)):
+        accounts.add(name, CloudflareClientManager(lambda fake=fake: fake.token, transport=httpx.ASGITransport(app=fake.app)))
+    engine = make_engine(home, tmp_path, records, accounts=accounts, scheduler=PollScheduler(0.1, jitter=0))
+
+    await engine.start()
+    await asyncio.sleep(0.6)
+    runs = [job.key for job in engine.jobs._jobs.values() if job.reason == "schedule"]
+    await engine.stop()
+    assert runs.count("default") >= 3 and runs.count("work") == 1
+    await accounts.close()
+
+
+@pytest.mark.asyncio
+async def test_cycles_are_written_to_history(tmp_path):
+    fake = FakeCloudflare()
+    records = [tracked(fake, "z0", "r0"), tracked(fake, "z0", "current", content=NEW_IP)]
+    history = SyncHistory(str(tmp_path))
+    engine = make_engine(fake, tmp_path, records, history=history)
+
+    job = await engine.jobs.run("manual")
+
+    [cycle] = history.cycles()["items"]
+    assert (cycle["job_id"], cycle["status"], cycle["ip"]) == (job.id, "done", NEW_IP)
+    assert (cycle["updated"], cycle["skipped"], cycle["failed"]) == (1, 1, 0)
+    [change] = history.changes()["items"]  # records already on the IP are not stored
+    assert (change["record_id"], change["old_ip"], change["new_ip"], change["status"]) == ("r0", OLD_IP, NEW_IP, "updated")
+    assert change["latency_ms"] >= 0
+    await engine.clients.close()
+    history.close()
+
+
+@pytest.mark.asyncio
+async def test_records_get_the_address_of_their_family(tmp_path):
+    fake = FakeCloudflare()
+    v4, v6 = tracked(fake, "z0", "v4"), dict(tracked(fake, "z0", "v6", content="2001:db8::1"), type="AAAA")
+    ipv6_host = WanIpDetector(clients={
+        4: httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_ip_app(NEW_IP))),
+        6: httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_ip_app("2001:db8::2"))),
+    })
+    engine = make_engine(fake, tmp_path, [v4, v6], detector=ipv6_host)
+
+    await engine._run_once()
+
+    assert fake.records["z0"]["v4"]["content"] == NEW_IP
+    assert fake.records["z0"]["v6"]["content"] == "2001:db8::2"
+    assert fake.requests["POST batch"] == 1
+    await engine.clients.close()
+
+
+@pytest.mark.asyncio
+async def test_records_of_an_undetected_family_are_skipped(tmp_path):
+    fake = FakeCloudflare()
+    v6 = dict(tracked(fake, "z0", "v6", content="2001:db8::1"), type="AAAA")
+    engine = make_engine(fake, tmp_path, [v6])  # the fake IP service only has IPv4
+
+    job = await engine.jobs.run("manual")
+
+    assert job.status == "done"
+    assert job.results["v6"] == {"name": v6["name"], "status": "skipped", "error": "no IPv6 address detected"}
+    assert fake.requests["POST batch"] == 0
+    assert fake.records["z0"]["v6"]["content"] == "2001:db8::1"
+    await engine.clients.close()
+
+
+@pytest.mark.asyncio
+async def test_fast_failures_are_reported_per_record(tmp_path):
+    fake = FakeCloudflare(retry_after=600)
+    records = [tracked(fake, "z0", "r0"), tracked(fake, "z1", "r1")]
+    engine = make_engine(fake, tmp_path, records, use_batch=True)
+    fake.throttle(2)
+
+    job = await engine.jobs.run("manual")
+
+    assert job.status == "failed"
+    assert all("past the deadline" in job.results[r]["error"] for r in ("r0", "r1"))
+    await engine.clients.close()
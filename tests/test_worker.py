@@ -0,0 +1,37 @@
+import subprocess
+import sys
+
+import httpx
+import pytest
+from app.cloudflare_client import CloudflareAccounts
+from app.config import ConfigManager
+from app.ip_detect import WanIpDetector
+from app.worker import run_once
+from tests.fake_cloudflare import FakeCloudflare, fake_ip_app
+
+NEW_IP = "198.51.100.7"
+
+
+@pytest.mark.asyncio
+async def test_run_once_syncs_and_reports_failure(tmp_path):
+    fake = FakeCloudflare()
+    rec = fake.add_record("z0", "r0", "192.0.2.1")
+    cfg = ConfigManager(data_dir=str(tmp_path), write_delay=0)
+    cfg.add_records([{"zone_id": "z0", "record_id": "r0", "name": rec["name"], "type": "A", "content": "192.0.2.1", "auto_update": True}])
+
+    def deps(ip_app):
+        accounts = CloudflareAccounts(lambda account: fake.token, transport=httpx.ASGITransport(app=fake.app))
+        detector = WanIpDetector(client=httpx.AsyncClient(transport=httpx.ASGITransport(app=ip_app)))
+        return accounts, detector
+
+    assert await run_once(cfg, *deps(fake_ip_app(NEW_IP)))
+    assert fake.records["z0"]["r0"]["content"] == NEW_IP
+
+    # no usable answer from any IP provider
+    assert not await run_once(cfg, *deps(fake_ip_app("not-an-ip")))
+
+
+def test_worker_does_not_import_the_web_stack():
+    code = "import sys, app.worker; print(any(m in sys.modules for m in ('fastapi', 'jinja2', 'starlette')))"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "False"